@@ -0,0 +1,307 @@
+import json
+import os
+import sqlite3
+import stat
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+load_dotenv()
+
+# One SQLite file per node shared by every worker process; a small LRU per process in front.
+# Its directory must be private (owned by this user, mode 0700) or the disk tier is disabled.
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(tempfile.gettempdir(), f"demystdocs_cache-{os.getuid()}"))
+CACHE_PATH = os.getenv("CACHE_PATH", os.path.join(CACHE_DIR, "cache.sqlite3"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+CACHE_MEMORY_MAX_BYTES = int(os.getenv("CACHE_MEMORY_MAX_BYTES", str(64 * 1024 * 1024)))
+# Last-access times on disk are only refreshed this often, so hits stay read-only
+_TOUCH_INTERVAL = 60.0
+# Keys whose last refresh time is remembered; forgetting one only costs an extra UPDATE
+_TOUCHED_MAX_KEYS = 10000
+# Check the on-disk size after this many bytes were written
+_EVICT_CHECK_BYTES = 4 * 1024 * 1024
+
+_MISSING = object()
+
+# Stored value formats: a tag byte, then JSON, or a JSON header line and raw array bytes
+_JSON, _ARRAY = b"J", b"A"
+
+
+def _encode(value: Any) -> bytes:
+    """Serialise a JSON-compatible value or a numeric numpy array.
+
+    Never pickle: anyone able to write the cache file could otherwise run
+    code in every worker that reads it.
+    """
+    if isinstance(value, np.ndarray):
+        if value.dtype.kind not in "biuf":
+            raise TypeError(f"Cannot cache arrays of dtype {value.dtype}")
+        header = json.dumps({"dtype": value.dtype.str, "shape": value.shape}).encode("utf-8")
+        return _ARRAY + header + b"\n" + np.ascontiguousarray(value).tobytes()
+    return _JSON + json.dumps(value).encode("utf-8")
+
+
+def _decode(blob: bytes) -> Any:
+    tag, body = blob[:1], blob[1:]
+    if tag == _JSON:
+        return json.loads(body)
+    if tag == _ARRAY:
+        header, _, data = body.partition(b"\n")
+        meta = json.loads(header)
+        dtype = np.dtype(meta["dtype"])
+        if dtype.kind not in "biuf":
+            raise ValueError(f"Unexpected cached dtype {dtype}")
+        return np.frombuffer(data, dtype=dtype).reshape(meta["shape"])
+    raise ValueError("Unknown cache entry format")
+
+
+def private_dir(path: str) -> bool:
+    """Create `path` with mode 0700, or check that an existing one is ours and private."""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    st = os.lstat(path)
+    return stat.S_ISDIR(st.st_mode) and st.st_uid == os.getuid() and not st.st_mode & 0o077
+
+
+class _TierStats:
+    __slots__ = ("hits", "misses")
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
+
+
+class TieredCache:
+    """Two-level cache: an in-process LRU in front of a SQLite (WAL) store.
+
+    The SQLite file is shared by every worker on the node, so a value
+    computed by one worker is a disk hit for the others. Values are stored
+    as JSON, or as raw bytes for numpy arrays, and each fill is a single
+    transaction, so readers see either the old
+    value or the new one, never a partial write. Both tiers are bounded by
+    size and evict least recently used entries first.
+
+    Keys are `(namespace, key)` pairs of strings; `key` should already
+    include everything that changes the value (content hash, model, version).
+    """
+
+    def __init__(self, path: Optional[str] = CACHE_PATH, max_bytes: int = CACHE_MAX_BYTES, memory_max_bytes: int = CACHE_MEMORY_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.memory_max_bytes = memory_max_bytes
+        self._memory: "OrderedDict[Tuple[str, str], Tuple[Any, int]]" = OrderedDict()
+        self._memory_bytes = 0
+        self._touched: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._written_since_check = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stats = {"memory": _TierStats(), "disk": _TierStats()}
+        self._disk_errors = 0
+
+    # --- disk tier ---
+    def _conn(self) -> Optional[sqlite3.Connection]:
+        if not self.path:
+            return None
+        # sqlite3 connections are per thread; the file itself is shared
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            if not private_dir(directory):
+                print(f"Cache directory {directory} is not private to this user; disk cache disabled")
+                self.path = None
+                return None
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL,"
+                " size INTEGER NOT NULL, accessed REAL NOT NULL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+            self._local.conn = conn
+        return conn
+
+    def _disk_get(self, namespace: str, key: str) -> Any:
+        try:
+            conn = self._conn()
+            if conn is None:
+                return _MISSING
+            row = conn.execute("SELECT value FROM entries WHERE namespace = ? AND key = ?", (namespace, key)).fetchone()
+            if row is None:
+                return _MISSING
+            now = time.time()
+            if self._should_touch((namespace, key), now):
+                conn.execute("UPDATE entries SET accessed = ? WHERE namespace = ? AND key = ?", (now, namespace, key))
+            return _decode(row[0])
+        except (sqlite3.Error, OSError, ValueError, KeyError, TypeError):
+            # The cache is an optimisation; a broken store is treated as a miss
+            self._disk_errors += 1
+            return _MISSING
+
+    def _should_touch(self, entry: Tuple[str, str], now: float) -> bool:
+        with self._lock:
+            if now - self._touched.get(entry, 0.0) <= _TOUCH_INTERVAL:
+                return False
+            self._touched[entry] = now
+            self._touched.move_to_end(entry)
+            while len(self._touched) > _TOUCHED_MAX_KEYS:
+                self._touched.popitem(last=False)
+            return True
+
+    def _disk_set_many(self, items: List[Tuple[str, str, bytes]]):
+        try:
+            conn = self._conn()
+            if conn is None:
+                return
+            now = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO entries (namespace, key, value, size, accessed) VALUES (?, ?, ?, ?, ?)",
+                    [(ns, k, blob, len(blob), now) for ns, k, blob in items],
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            with self._lock:
+                self._written_since_check += sum(len(blob) for _, _, blob in items)
+                check = self._written_since_check >= _EVICT_CHECK_BYTES
+                if check:
+                    self._written_since_check = 0
+            if check:
+                self._evict_disk(conn)
+        except (sqlite3.Error, OSError):
+            self._disk_errors += 1
+
+    def _evict_disk(self, conn: sqlite3.Connection):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop the least recently used entries down to 90% of the budget
+        excess = total - int(self.max_bytes * 0.9)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            freed = 0
+            victims = []
+            for namespace, key, size in conn.execute("SELECT namespace, key, size FROM entries ORDER BY accessed"):
+                if freed >= excess:
+                    break
+                victims.append((namespace, key))
+                freed += size
+            conn.executemany("DELETE FROM entries WHERE namespace = ? AND key = ?", victims)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        with self._lock:
+            for victim in victims:
+                self._touched.pop(victim, None)
+
+    # --- memory tier ---
+    def _memory_get(self, namespace: str, key: str) -> Any:
+        with self._lock:
+            entry = self._memory.get((namespace, key))
+            if entry is None:
+                return _MISSING
+            self._memory.move_to_end((namespace, key))
+            return entry[0]
+
+    def _memory_set(self, namespace: str, key: str, value: Any, size: int):
+        if size > self.memory_max_bytes:
+            return
+        with self._lock:
+            old = self._memory.pop((namespace, key), None)
+            if old is not None:
+                self._memory_bytes -= old[1]
+            self._memory[(namespace, key)] = (value, size)
+            self._memory_bytes += size
+            while self._memory_bytes > self.memory_max_bytes:
+                _, (_, evicted) = self._memory.popitem(last=False)
+                self._memory_bytes -= evicted
+
+    # --- public API ---
+    def get(self, namespace: str, key: str, default: Any = None) -> Any:
+        """Return a cached value, checking memory first and then disk."""
+        value = self._memory_get(namespace, key)
+        if value is not _MISSING:
+            self._stats["memory"].hits += 1
+            return value
+        self._stats["memory"].misses += 1
+
+        value = self._disk_get(namespace, key)
+        if value is _MISSING:
+            self._stats["disk"].misses += 1
+            return default
+        self._stats["disk"].hits += 1
+        self._memory_set(namespace, key, value, _approx_size(value))
+        return value
+
+    def set(self, namespace: str, key: str, value: Any):
+        self.set_many(namespace, {key: value})
+
+    def get_many(self, namespace: str, keys: Iterable[str]) -> Dict[str, Any]:
+        """Return the cached subset of `keys` as a dict (misses are left out)."""
+        found = {}
+        for key in keys:
+            value = self.get(namespace, key, _MISSING)
+            if value is not _MISSING:
+                found[key] = value
+        return found
+
+    def set_many(self, namespace: str, values: Dict[str, Any]):
+        """Store several values in both tiers; the disk write is one transaction."""
+        items = []
+        for key, value in values.items():
+            blob = _encode(value)
+            self._memory_set(namespace, key, value, len(blob))
+            items.append((namespace, key, blob))
+        if items:
+            self._disk_set_many(items)
+
+    def get_or_set(self, namespace: str, key: str, fn: Callable[[], Any]) -> Any:
+        """Return the cached value, or compute it with `fn` and store it."""
+        value = self.get(namespace, key, _MISSING)
+        if value is _MISSING:
+            value = fn()
+            self.set(namespace, key, value)
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-tier hit/miss counters for this worker, plus tier sizes."""
+        with self._lock:
+            memory = {"entries": len(self._memory), "bytes": self._memory_bytes}
+        disk = {"path": self.path, "errors": self._disk_errors}
+        try:
+            conn = self._conn()
+            if conn is not None:
+                entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+                disk.update(entries=entries, bytes=size)
+        except sqlite3.Error:
+            pass
+        return {
+            "pid": os.getpid(),
+            "memory": {**memory, **self._stats["memory"].as_dict()},
+            "disk": {**disk, **self._stats["disk"].as_dict()},
+        }
+
+
+def _approx_size(value: Any) -> int:
+    nbytes = getattr(value, "nbytes", None)
+    if isinstance(nbytes, int):
+        return nbytes
+    return len(_encode(value))
+
+
+# Shared by every lib module in this worker
+cache = TieredCache()
@@ -0,0 +1,104 @@
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+def _normalize_ws(text: str) -> str:
+    return " ".join((text or "").split()).strip()
+
+
+class ChunkSet:
+    """Compact, column-wise store for the chunks of one document.
+
+    Instead of one dict per chunk, the document text is held once and every
+    chunk is a `[start, end)` slice of it. Pages and flags live in parallel
+    typed arrays and all vectors share one contiguous float32 matrix
+    (`vectors[i]` belongs to chunk `i`), which is about 3 KB per
+    768-dimension vector instead of 20+ KB as a list of Python floats.
+
+    Chunks whose text is not one contiguous slice (multi-segment layouts,
+    windows that skip filtered paragraphs) also keep their segments in
+    `segments`; `starts`/`ends` then only bound them.
+    """
+
+    __slots__ = ("document_id", "full_text", "ids", "starts", "ends", "pages", "page_ends", "windows", "segments", "vectors", "_positions")
+
+    def __init__(self, document_id: str, full_text: str):
+        self.document_id = document_id
+        self.full_text = full_text
+        self.ids: List[str] = []
+        self.starts = array("I")
+        self.ends = array("I")
+        self.pages = array("H")
+        self.page_ends = array("H")
+        self.windows = array("b")  # 1 for merged structural windows
+        # Row -> [start, end) segments, only for non-contiguous chunks
+        self.segments: Dict[int, Tuple[Tuple[int, int], ...]] = {}
+        self.vectors: Optional[np.ndarray] = None
+        self._positions: Optional[Dict[str, int]] = None
+
+    @classmethod
+    def from_chunks(cls, chunks: Iterable[Dict], full_text: str, document_id: str) -> "ChunkSet":
+        """Builds a ChunkSet from chunk dicts carrying `start`/`end` offsets (and optional `segments`)."""
+        chunk_set = cls(document_id, full_text)
+        for chunk in chunks:
+            chunk_set.append(
+                chunk["id"], chunk["start"], chunk["end"], chunk["page_number"],
+                chunk.get("page_end", chunk["page_number"]), chunk.get("kind") == "window",
+                chunk.get("segments"),
+            )
+        return chunk_set
+
+    def append(
+        self, chunk_id: str, start: int, end: int, page: int, page_end: int,
+        window: bool = False, segments: Optional[Sequence[Tuple[int, int]]] = None,
+    ):
+        if segments is not None and len(segments) > 1:
+            self.segments[len(self.ids)] = tuple((s, e) for s, e in segments)
+        self.ids.append(chunk_id)
+        self.starts.append(start)
+        self.ends.append(end)
+        self.pages.append(page)
+        self.page_ends.append(page_end)
+        self.windows.append(1 if window else 0)
+        self._positions = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def text_at(self, i: int) -> str:
+        """Whitespace-normalized text of chunk `i`, sliced on demand."""
+        segments = self.segments.get(i)
+        if segments is not None:
+            return _normalize_ws("".join(self.full_text[s:e] for s, e in segments))
+        return _normalize_ws(self.full_text[self.starts[i]:self.ends[i]])
+
+    def is_window(self, i: int) -> bool:
+        return bool(self.windows[i])
+
+    def index_of(self, chunk_id: str) -> Optional[int]:
+        if self._positions is None:
+            self._positions = {cid: i for i, cid in enumerate(self.ids)}
+        return self._positions.get(chunk_id)
+
+    def subset(self, indices: List[int]) -> "ChunkSet":
+        """New ChunkSet with the given rows; the document text is shared."""
+        chunk_set = ChunkSet(self.document_id, self.full_text)
+        for i in indices:
+            chunk_set.append(
+                self.ids[i], self.starts[i], self.ends[i], self.pages[i], self.page_ends[i],
+                self.windows[i], self.segments.get(i),
+            )
+        if self.vectors is not None:
+            chunk_set.vectors = self.vectors[indices]
+        return chunk_set
+
+    def nbytes(self) -> int:
+        """Approximate memory held by this set, excluding the shared text."""
+        size = sum(a.itemsize * len(a) for a in (self.starts, self.ends, self.pages, self.page_ends, self.windows))
+        size += sum(len(cid) + 49 for cid in self.ids)
+        size += sum(64 + 16 * len(segments) for segments in self.segments.values())
+        if self.vectors is not None:
+            size += self.vectors.nbytes
+        return size
@@ -0,0 +1,259 @@
+import contextvars
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from dataclasses import dataclass
+from dotenv import load_dotenv
+from typing import Any, Callable, Dict, Optional
+
+import httpx
+from google.api_core import exceptions as google_exceptions
+from .scheduler import scheduler
+from .profiler import profiler
+
+load_dotenv()
+
+# End-to-end budget for one API request, for an upload (/get_ocr waits on
+# Document AI, whose attempts alone may take 120s), and for background ingestion
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "90"))
+UPLOAD_DEADLINE_SECONDS = float(os.getenv("UPLOAD_DEADLINE_SECONDS", "300"))
+INGEST_DEADLINE_SECONDS = float(os.getenv("INGEST_DEADLINE_SECONDS", "600"))
+# Send a second copy of an idempotent read if the first is this slow (0 = off)
+HEDGE_AFTER_SECONDS = float(os.getenv("HEDGE_AFTER_SECONDS", "0"))
+# Attempts per stage allowed to keep running after their caller gave up on
+# them (clients without a native timeout); further attempts fail fast
+MAX_ABANDONED_ATTEMPTS = int(os.getenv("MAX_ABANDONED_ATTEMPTS", "4"))
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request's deadline ran out; the call was not (re)tried."""
+
+
+class StageTimeout(TimeoutError):
+    """One attempt exceeded its per-attempt timeout; may be retried."""
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    attempts: int = 3
+    base_delay: float = 0.2
+    max_delay: float = 2.0
+    # Upper bound for a single attempt, further capped by the deadline
+    timeout: float = 30.0
+    # Hedge idempotent reads after this many seconds (None = never)
+    hedge_after: Optional[float] = None
+
+
+_hedge = HEDGE_AFTER_SECONDS or None
+POLICIES: Dict[str, RetryPolicy] = {
+    "document_ai": RetryPolicy(attempts=2, timeout=120.0),
+    "embeddings": RetryPolicy(attempts=3, timeout=20.0, hedge_after=_hedge),
+    "vector_search": RetryPolicy(attempts=3, timeout=10.0, hedge_after=_hedge),
+    "vector_write": RetryPolicy(attempts=3, timeout=60.0),
+    "generate": RetryPolicy(attempts=2, timeout=90.0),
+    "storage": RetryPolicy(attempts=3, timeout=30.0, hedge_after=_hedge),
+    "storage_write": RetryPolicy(attempts=3, timeout=30.0),
+}
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("deadline", default=None)
+# Attempts run here so a stalled upstream call cannot hold the caller past its budget.
+# Sized above the scheduler's total slots so admitted calls never queue again here.
+_executor = ThreadPoolExecutor(max_workers=64, thread_name_prefix="upstream")
+
+
+@contextmanager
+def deadline_scope(seconds: float, inherit: bool = True):
+    """Give the enclosed work (and threads started from it) `seconds` in total.
+
+    Nested scopes can only shorten an outer deadline, never extend it, unless
+    `inherit=False` (for background work that outlives its request).
+    """
+    deadline = time.monotonic() + seconds
+    outer = _deadline.get() if inherit else None
+    token = _deadline.set(deadline if outer is None else min(outer, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left in the current deadline, or None when there is none."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def _is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, (DeadlineExceeded, ValueError, TypeError, KeyError)):
+        return False
+    if isinstance(exc, (StageTimeout, TimeoutError, ConnectionError, httpx.TransportError)):
+        return True
+    if isinstance(exc, httpx.HTTPStatusError):
+        code = exc.response.status_code
+        return code >= 500 or code in (408, 429)
+    if isinstance(exc, google_exceptions.GoogleAPICallError):
+        return isinstance(exc, (
+            google_exceptions.TooManyRequests,
+            google_exceptions.ServerError,
+            google_exceptions.DeadlineExceeded,
+            google_exceptions.Aborted,
+        ))
+    # Unknown client errors (e.g. storage3) are retried
+    return True
+
+
+# Attempts still running per stage after their caller stopped waiting
+_abandoned: Dict[str, int] = defaultdict(int)
+_abandoned_lock = threading.Lock()
+
+
+def timeout_kwarg(seconds: float) -> Dict[str, Any]:
+    """Native timeout for clients taking `timeout=` (gapic, AsyncStorage)."""
+    return {"timeout": seconds}
+
+
+def request_options_timeout(seconds: float) -> Dict[str, Any]:
+    """Native timeout for google.generativeai calls."""
+    return {"request_options": {"timeout": seconds}}
+
+
+def abandoned_attempts() -> Dict[str, int]:
+    with _abandoned_lock:
+        return {stage: n for stage, n in _abandoned.items() if n}
+
+
+def _abandon(stage: str, future: Future):
+    def _finished(_):
+        with _abandoned_lock:
+            _abandoned[stage] -= 1
+
+    with _abandoned_lock:
+        _abandoned[stage] += 1
+    future.add_done_callback(_finished)
+
+
+def _at_abandon_limit(stage: str) -> bool:
+    with _abandoned_lock:
+        return _abandoned[stage] >= MAX_ABANDONED_ATTEMPTS
+
+
+def _submit(stage: str, fn: Callable, args, kwargs) -> Future:
+    ctx = contextvars.copy_context()
+    future = _executor.submit(ctx.run, profiler.tracked(fn), *args, **kwargs)
+    # The scheduler slot is held until the call really finishes, even if
+    # the caller stopped waiting for it
+    future.add_done_callback(lambda _: scheduler.release(stage))
+    return future
+
+
+def _run_attempt(
+    stage: str,
+    fn: Callable,
+    args,
+    kwargs,
+    budget: float,
+    hedge_after: Optional[float],
+    native_timeout: Optional[Callable[[float], Dict[str, Any]]],
+) -> Any:
+    started = time.monotonic()
+    if _at_abandon_limit(stage):
+        raise StageTimeout(f"{stage}: {MAX_ABANDONED_ATTEMPTS} timed-out attempts still running")
+    # Time spent queued for the upstream counts against the attempt
+    if not scheduler.acquire(stage, budget):
+        raise StageTimeout(f"{stage}: no upstream slot within {budget:.1f}s")
+
+    def _copy() -> Future:
+        # The client gets the rest of the attempt budget as its own timeout,
+        # so a timed-out call frees its thread and scheduler slot
+        left = max(0.1, budget - (time.monotonic() - started))
+        extra = native_timeout(left) if native_timeout else {}
+        return _submit(stage, fn, args, {**kwargs, **extra})
+
+    futures = [_copy()]
+    try:
+        left = budget - (time.monotonic() - started)
+        if hedge_after is not None and hedge_after < left:
+            done, _ = wait(futures, timeout=hedge_after)
+            # Hedge only with a spare slot; under contention it would just add load
+            if not done and not _at_abandon_limit(stage) and scheduler.try_acquire(stage):
+                futures.append(_copy())
+
+        # First successful copy wins; a failure only counts once every copy failed
+        pending = set(futures)
+        error: Optional[BaseException] = None
+        while pending:
+            left = budget - (time.monotonic() - started)
+            if left <= 0:
+                break
+            done, pending = wait(pending, timeout=left, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        if error is not None and not pending:
+            raise error
+        raise StageTimeout(f"attempt timed out after {budget:.1f}s")
+    finally:
+        for future in futures:
+            if not future.done():
+                _abandon(stage, future)
+
+
+def call(
+    stage: str,
+    fn: Callable,
+    *args,
+    native_timeout: Optional[Callable[[float], Dict[str, Any]]] = None,
+    **kwargs,
+) -> Any:
+    """Run one external call under the current deadline.
+
+    Each attempt waits for a slot from the scheduler and is capped by the
+    stage's timeout and by the time left in the deadline. Retryable
+    failures are retried with jittered exponential backoff; stages with
+    `hedge_after` also race a duplicate request when the first one is slow,
+    which is only safe for idempotent reads.
+
+    Pass `native_timeout` (`timeout_kwarg` or `request_options_timeout`)
+    when the client supports a timeout, so the call itself stops when the
+    attempt does. Clients without one keep running in the background after
+    the attempt times out; at most MAX_ABANDONED_ATTEMPTS of those per stage
+    are allowed before further attempts fail fast.
+
+    Raises:
+        DeadlineExceeded: the deadline ran out before a successful attempt.
+    """
+    policy = POLICIES[stage]
+    last_error: Optional[BaseException] = None
+    out_of_time = False
+    for attempt in range(policy.attempts):
+        left = remaining()
+        if left is not None and left <= 0:
+            out_of_time = True
+            break
+        budget = policy.timeout if left is None else min(policy.timeout, left)
+        try:
+            return _run_attempt(stage, fn, args, kwargs, budget, policy.hedge_after, native_timeout)
+        except Exception as e:  # noqa: BLE001
+            if not _is_retryable(e):
+                raise
+            last_error = e
+
+        if attempt + 1 < policy.attempts:
+            # Full jitter keeps retrying workers from synchronising
+            delay = random.uniform(0, min(policy.max_delay, policy.base_delay * 2 ** attempt))
+            left = remaining()
+            if left is not None and delay >= left:
+                out_of_time = True
+                break
+            time.sleep(delay)
+
+    left = remaining()
+    if out_of_time or last_error is None or (left is not None and left <= 0):
+        raise DeadlineExceeded(f"{stage}: deadline exceeded") from last_error
+    raise last_error
+
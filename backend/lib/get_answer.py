@@ -5,8 +5,9 @@ from typing import List
 from google.cloud import aiplatform
 from google.cloud.aiplatform.matching_engine.matching_engine_index_endpoint import Namespace
 import google.generativeai as genai
-from vertexai.language_models import TextEmbeddingModel
-from .rag_builder import create_chunks_from_doc_ai_json
+from .rag_builder import embed_texts, load_chunk_set
+from .quantization import search_resident
+from .deadline import call, request_options_timeout
 
 load_dotenv()
 
@@ -84,70 +85,73 @@ def answer_user_question(question: str, file_url: str) -> str:
     document_id = file_url[5:-5:]
 
     # 0. Load and chunk the document
-    original_chunks = create_chunks_from_doc_ai_json(file_url, document_id)
+    chunk_set = load_chunk_set(file_url, document_id)
 
     # print(f"Question: {question}")
 
     # Initialize models and index endpoint
     aiplatform.init(project=PROJECT_ID, location=LOCATION)
-    embedding_model = TextEmbeddingModel.from_pretrained("text-embedding-004")
     model = genai.GenerativeModel("gemini-2.5-flash")
-    index_endpoint = aiplatform.MatchingEngineIndexEndpoint(
-        index_endpoint_name=VECTOR_SEARCH_ENDPOINT_ID
-    )
 
-    # 1. Embed the user's question
-    embedding_response = embedding_model.get_embeddings([question])
-    question_embedding = embedding_response[0].values
+    # 1. Embed the user's question (repeated questions hit the shared cache)
+    question_embedding = embed_texts([question])[0].tolist()
     # print("1. Question embedded.")
 
-    # 2. Search the index for relevant chunks, filtering by document_id
-    search_results = index_endpoint.find_neighbors(
-        deployed_index_id=DEPLOYED_INDEX_ID,
-        queries=[question_embedding],
-        num_neighbors=25,
-        filter=[ Namespace(name="document_id", allow_tokens=[document_id], deny_tokens=[]) ],
-    )
+    # 2. Search for relevant chunks: the resident quantized copy of the
+    # document if this worker has one, else the index filtered by document_id
+    neighbor_ids: List[str] = []
+    resident_matches = search_resident(document_id, question_embedding, 25)
+    if resident_matches is not None:
+        neighbor_ids = [chunk_id for chunk_id, _ in resident_matches]
+    else:
+        index_endpoint = aiplatform.MatchingEngineIndexEndpoint(
+            index_endpoint_name=VECTOR_SEARCH_ENDPOINT_ID
+        )
+        search_results = call(
+            "vector_search", index_endpoint.find_neighbors,
+            deployed_index_id=DEPLOYED_INDEX_ID,
+            queries=[question_embedding],
+            num_neighbors=25,
+            filter=[ Namespace(name="document_id", allow_tokens=[document_id], deny_tokens=[]) ],
+        )
+        if search_results and search_results[0]:
+            for match in search_results[0]:
+                # In your SDK, neighbor ID may be 'id' or 'datapoint_id'
+                chunk_id = getattr(match, "datapoint_id", None) or getattr(match, "id", None)
+                if chunk_id:
+                    neighbor_ids.append(chunk_id)
     # print("2. Vector search complete.")
 
     # 3. Retrieve and post-filter the top matching chunks
-    chunks_map = {
-        chunk['id']: chunk['text']
-        for chunk in original_chunks
-        if chunk.get('document_id') == document_id
-    }
+    # Structural windows may start with a heading, so they skip the
+    # low-value and heading filters below
+    def _chunk_text(chunk_id: str):
+        i = chunk_set.index_of(chunk_id)
+        if i is None:
+            return "", False
+        return chunk_set.text_at(i), chunk_set.is_window(i)
 
     relevant_texts: List[str] = []
-    if search_results and search_results[0]:
-        for match in search_results[0]:
-            # In your SDK, neighbor ID may be 'id' or 'datapoint_id'
-            chunk_id = getattr(match, "datapoint_id", None) or getattr(match, "id", None)
-            if not chunk_id:
-                continue
-
-            context_text = _normalize_ws(chunks_map.get(chunk_id, ""))
-            if not context_text or _is_low_value(context_text):
-                continue
-            if context_text.lower() in {t.lower() for t in relevant_texts}:
-                continue
-            relevant_texts.append(context_text)
-            if len(relevant_texts) >= MAX_CONTEXT_CHUNKS:
-                break
+    for chunk_id in neighbor_ids:
+        context_text, is_window = _chunk_text(chunk_id)
+        if not context_text or (not is_window and _is_low_value(context_text)):
+            continue
+        if context_text.lower() in {t.lower() for t in relevant_texts}:
+            continue
+        relevant_texts.append(context_text)
+        if len(relevant_texts) >= MAX_CONTEXT_CHUNKS:
+            break
 
     # Fallback: relax filters if fewer than MIN_CONTEXT_CHUNKS
-    if len(relevant_texts) < MIN_CONTEXT_CHUNKS and search_results and search_results[0]:
-        for match in search_results[0]:
+    if len(relevant_texts) < MIN_CONTEXT_CHUNKS:
+        for chunk_id in neighbor_ids:
             if len(relevant_texts) >= MIN_CONTEXT_CHUNKS:
                 break
 
-            chunk_id = getattr(match, "datapoint_id", None) or getattr(match, "id", None)
-            if not chunk_id:
-                continue
-
-            context_text = _normalize_ws(chunks_map.get(chunk_id, ""))
+            context_text, is_window = _chunk_text(chunk_id)
             if not context_text:
                 continue
-            if _looks_like_heading(context_text):
+            if not is_window and _looks_like_heading(context_text):
                 continue
             if _is_mostly_non_alpha(context_text):
                 continue
@@ -175,7 +179,7 @@ def answer_user_question(question: str, file_url: str) -> str:
     """
 
     # 5. Get the final answer from the generation model
-    response = model.generate_content(final_prompt)
+    response = call("generate", model.generate_content, final_prompt, native_timeout=request_options_timeout)
     # print("4. Generated final answer from Gemini.")
 
     return response.text.strip()
@@ -5,21 +5,24 @@ from dotenv import load_dotenv
 from typing import Any, Dict
 
 import google.generativeai as genai
-from supabase import create_client, Client
+from .risk_candidates import select_risk_candidates, format_risk_candidates
+from .rag_builder import load_index_manifest
+from .result_store import content_hash, load_result, save_result
+from .storage import storage
+from .deadline import DeadlineExceeded, call, request_options_timeout, timeout_kwarg
 
-# Import supabase and create client
 load_dotenv()
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-BUCKET = os.getenv("SUPABASE_BUCKET")
-
-client: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
 # Import gemini api key
 API_KEY = os.getenv("GOOGLE_API_KEY")
 if API_KEY:
     genai.configure(api_key=API_KEY)
 
+# Bump RISK_PROMPT_VERSION whenever the prompt or candidate selection
+# changes so stored results are recomputed
+RISK_MODEL = "gemini-2.5-flash"
+RISK_PROMPT_VERSION = "v1"
+
 def _extract_json_object(text: str) -> Dict[str, Any]:
     """Best-effort extraction of a JSON object from a model response string.
 
@@ -96,16 +99,42 @@ def get_risk_statments(file_url: str):
         if file_url.startswith(prefix):
             file_url = file_url.replace(prefix, "", 1)
 
-        # Download the file from Supabase storage
-        response = client.storage.from_(BUCKET).download(file_url)
-        content = json.loads(response.decode("utf-8")) if isinstance(response, (bytes, bytearray)) else json.loads(str(response))
-        content = content.get("text")
-        model = genai.GenerativeModel("gemini-2.5-flash")
+        # Download the file from Supabase storage (shared pool + blob cache)
+        raw = call("storage", storage.download_sync, file_url, native_timeout=timeout_kwarg)
+
+        # Return the result stored at ingestion or by an earlier request
+        document_id = file_url[5:-5:]
+        doc_hash = content_hash(raw)
+        stored = load_result("risk", document_id, doc_hash, RISK_PROMPT_VERSION, RISK_MODEL)
+        if stored is not None:
+            return stored
+
+        doc_ai_json = json.loads(raw.decode("utf-8"))
+        content = doc_ai_json.get("text")
+        model = genai.GenerativeModel(RISK_MODEL)
 
         # Guard: if no content, return empty structure
         if not content or not isinstance(content, str) or not content.strip():
             return {"risk_statment": []}
 
+        # Candidates picked before the document is indexed rest on keywords
+        # only; such a result is returned but not stored
+        try:
+            indexed = bool(load_index_manifest(document_id))
+        except DeadlineExceeded:
+            raise
+        except Exception:
+            indexed = False
+
+        # Pre-select candidate clauses locally so only those reach the model.
+        # Fall back to the full text when nothing was selected.
+        candidates = select_risk_candidates(file_url, document_id, doc_ai_json)
+        if candidates:
+            source_description = "a list of candidate clauses pre-selected from the OCR extracted text of a rental agreement document. Each clause is prefixed with its page number and the risk categories it may match"
+            content = format_risk_candidates(candidates)
+        else:
+            source_description = "a OCR extracted text from a rental agreement document"
+
         # Call Gemini API to extract risk statements
         prompt = f"""
         You are a risk identifier.
@@ -196,9 +225,9 @@ def get_risk_statments(file_url: str):
                 potentially for the landlord's partial fault as well.
 
         TASK:
-            - You are given a OCR extracted text from a rental agreement document.
+            - You are given {source_description}.
             - Your task is to extract and list all the risky statements/clauses from the text using the above given instructions.
-            - In statment you must provide the exact wording of the input text that you identify as risky.
+            - In statment you must provide the exact wording of the input text that you identify as risky (without the page prefix).
             - In explanation you must provide a brief explanation of why the statement is considered risky.
 
         ANSWER FORMAT (STRICT):
@@ -214,7 +243,7 @@ def get_risk_statments(file_url: str):
         """
         
         
-        response = model.generate_content(prompt)
+        response = call("generate", model.generate_content, prompt, native_timeout=request_options_timeout)
 
         # Parse model output into the requested structure
         parsed = _extract_json_object(response.text if hasattr(response, "text") else str(response))
@@ -229,8 +258,12 @@ def get_risk_statments(file_url: str):
                 items.append({"statement": stmt.strip(), "explanation": expl.strip()})
 
         result = {"risk_statment": items}
+        if indexed:
+            save_result("risk", document_id, doc_hash, RISK_PROMPT_VERSION, RISK_MODEL, result)
         # print(result)
         return result
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         raise Exception(f"Error in get_risk_statments: {str(e)}")
     
@@ -2,23 +2,77 @@ import os
 import json
 import asyncio
 from dotenv import load_dotenv
-from typing import Dict
+from typing import Dict, Tuple
 
-from supabase import create_client, Client
 import google.generativeai as genai
 from .rag_builder import create_rag
+from .single_flight import coalescer, document_key
+from .result_store import content_hash, load_result, save_result
+from .storage import storage
+from .deadline import call, request_options_timeout, timeout_kwarg
+from .scheduler import INGESTION, priority_scope
+from .profiler import profiler
 
 load_dotenv()  # Load environment variables from .env file
 
-# Initialize Supabase client
-url: str = os.getenv("SUPABASE_URL")
-key: str = os.getenv("SUPABASE_KEY")
-bucket:str = os.getenv("SUPABASE_BUCKET")
-supabase: Client = create_client(url, key)
-
 # Initialize Generative AI client
 genai.configure(api_key=os.getenv("GENAI_API_KEY"))
 
+# Bump SUMMARY_PROMPT_VERSION whenever the prompt changes so stored
+# summaries are recomputed
+SUMMARY_MODEL = "gemini-2.5-flash"
+SUMMARY_PROMPT_VERSION = "v1"
+
+# Indexing runs left in the background after a stored-summary hit
+_background_tasks = set()
+
+def _download(file_path: str) -> bytes:
+    return call("storage", storage.download_sync, file_path, native_timeout=timeout_kwarg)
+
+def _load_or_generate_summary(file_path: str) -> Tuple[Dict[str, str], bool]:
+    """Returns (summary, was_stored)."""
+    raw = _download(file_path)
+    document_id = file_path[5:-5:]
+    doc_hash = content_hash(raw)
+    stored = load_result("summary", document_id, doc_hash, SUMMARY_PROMPT_VERSION, SUMMARY_MODEL)
+    if stored is not None:
+        return stored, True
+
+    decoded = raw.decode("utf-8")
+    try:
+        data = json.loads(decoded)
+        content_text = data.get("text", decoded) if isinstance(data, dict) else decoded
+    except json.JSONDecodeError:
+        content_text = decoded
+
+    model = genai.GenerativeModel(SUMMARY_MODEL)
+    prompt = "Summarize the following document content in a concise manner:\n\n"f"{content_text}\n\nSummary:"
+    response = call("generate", model.generate_content, prompt, native_timeout=request_options_timeout)
+    result = {"summary": response.candidates[0].content.parts[0].text}
+    save_result("summary", document_id, doc_hash, SUMMARY_PROMPT_VERSION, SUMMARY_MODEL, result)
+    return result, False
+
+def compute_summary(file_path: str) -> Dict[str, str]:
+    """Return the stored summary for the document, generating and storing it on a miss.
+
+    Args:
+        file_path: The path to the file in the Supabase storage bucket.
+    Returns:
+        A dictionary containing the summary text.
+    """
+    return _load_or_generate_summary(file_path)[0]
+
+def index_document(file_path: str):
+    """Build or update the document's vector index at ingestion priority."""
+    # Embedding and upsert batches queue behind interactive work
+    with priority_scope(INGESTION):
+        create_rag(file_path)
+
+def _finish_background(task: asyncio.Future):
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception():
+        print(f"Background indexing failed: {task.exception()}")
+
 async def get_summary(file_path: str) -> Dict[str, str]:
     """Generate a summary for the document at the given Supabase file path.
 
@@ -27,28 +81,27 @@ async def get_summary(file_path: str) -> Dict[str, str]:
     Returns:
         A dictionary containing the summary text.
     """
-    # Run RAG and (download+generate) in parallel
-    rag_task = asyncio.to_thread(create_rag, file_path)
-
-    def _download_and_generate() -> str:
-        resp = supabase.storage.from_(bucket).download(file_path)
-        # print(f"=============Downloaded file content from supabase")  # Print first 100 characters for debugging
-        decoded = resp.decode("utf-8") if isinstance(resp, (bytes, bytearray)) else str(resp)
-        try:
-            data = json.loads(decoded)
-            content_text = data.get("text", decoded) if isinstance(data, dict) else decoded
-        except json.JSONDecodeError:
-            content_text = decoded
-
-        model = genai.GenerativeModel("gemini-2.5-flash")
-        prompt = "Summarize the following document content in a concise manner:\n\n"f"{content_text}\n\nSummary:"
-        response = model.generate_content(
-            prompt
-        )
-        return response.candidates[0].content.parts[0].text
-
-    summary_text, _ = await asyncio.gather(asyncio.to_thread(_download_and_generate), rag_task)
-    return {"summary": summary_text}
+    # Run RAG and (download+generate) in parallel; concurrent requests for
+    # the same document share one indexing run
+    rag_task = asyncio.ensure_future(
+        coalescer.do(("create_rag", document_key(file_path)), lambda: asyncio.to_thread(profiler.tracked(index_document), file_path))
+    )
+
+    try:
+        summary, was_stored = await asyncio.to_thread(profiler.tracked(_load_or_generate_summary), file_path)
+    except Exception:
+        _background_tasks.add(rag_task)
+        rag_task.add_done_callback(_finish_background)
+        raise
+    if was_stored:
+        # Stored at ingestion or by an earlier request: answer now and let
+        # the (incremental) indexing finish in the background
+        _background_tasks.add(rag_task)
+        rag_task.add_done_callback(_finish_background)
+        return summary
+
+    await rag_task
+    return summary
 
 if __name__ == "__main__":
     file_path = "ocr/794bd64f-22ce-4840-af5b-2d7fe3f039c0.json"
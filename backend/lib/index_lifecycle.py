@@ -0,0 +1,241 @@
+import asyncio
+import json
+import os
+import re
+import socket
+import time
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from typing import Dict, List, Optional
+
+from .rag_builder import (
+    create_chunks_from_doc_ai_json,
+    legacy_chunk_ids,
+    load_doc_ai_json,
+    load_index_manifest,
+    may_have_legacy_ids,
+    remove_vectors_from_vector_search,
+)
+from .quantization import drop_resident
+from .result_store import list_result_paths
+from .ocr_index import ocr_index_paths
+from .deadline import call, deadline_scope, timeout_kwarg
+from .storage import storage
+
+load_dotenv()
+
+PUBLIC_URL_PREFIX = "https://jmyrzhpfzcaebymsmjcm.supabase.co/storage/v1/object/public/ocr_bucket/"
+
+# Documents not accessed for this long are deleted by the sweeper (0 disables it)
+DOCUMENT_TTL_HOURS = float(os.getenv("DOCUMENT_TTL_HOURS", "0"))
+SWEEP_INTERVAL_SECONDS = int(os.getenv("SWEEP_INTERVAL_SECONDS", "3600"))
+# Rewrite a registry entry at most this often per document and worker;
+# at most half the TTL so an active document is never seen as expired
+TOUCH_INTERVAL_SECONDS = min(3600, DOCUMENT_TTL_HOURS * 3600 / 2) if DOCUMENT_TTL_HOURS > 0 else 3600
+# Own budget for a registry write, so bookkeeping never eats a request's deadline
+REGISTRY_WRITE_SECONDS = 10.0
+LIST_PAGE_SIZE = 1000
+# Storage object only one worker can create per sweep interval
+SWEEP_LEASE_DIR = "locks"
+SWEEP_LEASE_NAME = "ttl_sweeper.json"
+
+# Uploaded OCR artifacts are always ocr/<uuid4>.json
+_DOCUMENT_PATH = re.compile(r"^ocr/[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\.json$")
+
+_last_touch: Dict[str, float] = {}
+
+
+def _to_bucket_path(file_path: str) -> str:
+    if file_path.startswith(PUBLIC_URL_PREFIX):
+        file_path = file_path.replace(PUBLIC_URL_PREFIX, "", 1)
+    return file_path
+
+
+def document_path(file_path: str) -> str:
+    """Bucket path of an uploaded document, from a bucket path or public URL.
+
+    Raises:
+        ValueError: `file_path` is not an `ocr/<uuid>.json` document.
+    """
+    bucket_file_path = _to_bucket_path(file_path)
+    if not _DOCUMENT_PATH.match(bucket_file_path):
+        raise ValueError(f"Not a document path: {file_path!r}")
+    return bucket_file_path
+
+
+def _registry_path(document_id: str) -> str:
+    return f"registry/{document_id}.json"
+
+
+def touch_document(file_path: str):
+    """Record that a document was ingested or used.
+
+    Creates or refreshes the document's entry in the ingestion registry
+    (`registry/<document_id>.json`). The object's `updated_at` timestamp is
+    what the TTL sweeper reads, so writes are throttled per worker.
+
+    Best effort: paths that are not documents are ignored, and a failed
+    write is logged and retried on the next touch instead of raised.
+    """
+    try:
+        bucket_file_path = document_path(file_path)
+    except ValueError:
+        return
+    document_id = bucket_file_path[5:-5:]
+    now = time.time()
+    if now - _last_touch.get(document_id, 0) < TOUCH_INTERVAL_SECONDS:
+        return
+
+    entry = {
+        "document_id": document_id,
+        "file_path": bucket_file_path,
+        "last_accessed_at": datetime.now(timezone.utc).isoformat(),
+    }
+    try:
+        with deadline_scope(REGISTRY_WRITE_SECONDS, inherit=False):
+            call(
+                "storage_write", storage.upload_sync, _registry_path(document_id),
+                json.dumps(entry).encode("utf-8"),
+                native_timeout=timeout_kwarg,
+            )
+    except Exception as e:  # noqa: BLE001
+        print(f"Could not update registry entry for {document_id}: {e}")
+        return
+    _last_touch[document_id] = now
+
+
+def delete_document(file_path: str) -> Dict[str, int]:
+    """Delete a document's datapoints and all of its storage artifacts.
+
+    Args:
+        file_path: Supabase file path or public URL of the OCR JSON.
+    Returns:
+        Counts of removed datapoints and storage objects.
+    Raises:
+        ValueError: `file_path` is not an `ocr/<uuid>.json` document.
+    """
+    bucket_file_path = document_path(file_path)
+    document_id = bucket_file_path[5:-5:]
+
+    datapoint_ids = load_index_manifest(document_id)
+    if datapoint_ids is None:
+        # No manifest: recompute the ids the document could have been indexed under
+        try:
+            doc_ai_json = load_doc_ai_json(bucket_file_path)
+        except Exception:
+            doc_ai_json = None
+        datapoint_ids = []
+        if doc_ai_json is not None:
+            chunks = create_chunks_from_doc_ai_json(bucket_file_path, document_id, doc_ai_json)
+            datapoint_ids = [chunk["id"] for chunk in chunks]
+            if may_have_legacy_ids(bucket_file_path):
+                datapoint_ids += legacy_chunk_ids(doc_ai_json, document_id)
+    remove_vectors_from_vector_search(sorted(set(datapoint_ids)))
+    drop_resident(document_id)
+
+    artifacts = [
+        bucket_file_path,
+        f"index/{document_id}.json",
+        _registry_path(document_id),
+    ] + list_result_paths(document_id) + ocr_index_paths(document_id)
+    removed = call("storage_write", storage.remove_sync, artifacts, native_timeout=timeout_kwarg) or []
+    _last_touch.pop(document_id, None)
+    return {"datapoints": len(set(datapoint_ids)), "objects": len(removed)}
+
+
+def _list_registry() -> List[dict]:
+    entries: List[dict] = []
+    offset = 0
+    while True:
+        page = call(
+            "storage", storage.list_sync, "registry", limit=LIST_PAGE_SIZE, offset=offset, native_timeout=timeout_kwarg
+        )
+        entries.extend(page or [])
+        if not page or len(page) < LIST_PAGE_SIZE:
+            return entries
+        offset += LIST_PAGE_SIZE
+
+
+def _parse_timestamp(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+def sweep_expired_documents(ttl_hours: float = DOCUMENT_TTL_HOURS) -> List[str]:
+    """Delete every registered document not accessed within `ttl_hours`.
+
+    Returns:
+        The ids of the deleted documents.
+    """
+    cutoff = time.time() - ttl_hours * 3600
+    deleted: List[str] = []
+    for obj in _list_registry():
+        name = obj.get("name", "")
+        if not name.endswith(".json"):
+            continue
+        last_accessed = _parse_timestamp(obj.get("updated_at") or obj.get("created_at"))
+        if last_accessed is None or last_accessed >= cutoff:
+            continue
+        document_id = name[:-5]
+        if not _DOCUMENT_PATH.match(f"ocr/{document_id}.json"):
+            # Not a document (written before paths were validated): drop the entry
+            try:
+                call("storage_write", storage.remove_sync, [_registry_path(document_id)], native_timeout=timeout_kwarg)
+            except Exception as e:  # noqa: BLE001
+                print(f"TTL sweep: failed to remove registry entry {name}: {e}")
+            continue
+        try:
+            delete_document(f"ocr/{document_id}.json")
+            deleted.append(document_id)
+        except Exception as e:  # noqa: BLE001
+            print(f"TTL sweep: failed to delete {document_id}: {e}")
+    return deleted
+
+
+def _acquire_sweep_lease(interval_seconds: int) -> bool:
+    """Claim this sweep interval for the current worker.
+
+    The lease is a storage object created without upsert, so only one
+    worker's create succeeds. It is left in place; once it is older than
+    `interval_seconds` the next worker to check replaces it.
+    """
+    lease_path = f"{SWEEP_LEASE_DIR}/{SWEEP_LEASE_NAME}"
+    holder = {"holder": f"{socket.gethostname()}:{os.getpid()}", "acquired_at": datetime.now(timezone.utc).isoformat()}
+    for _ in range(2):
+        try:
+            # Not through call(): a conflict means the lease is taken, not a retryable failure
+            storage.upload_sync(lease_path, json.dumps(holder).encode("utf-8"), upsert=False, timeout=REGISTRY_WRITE_SECONDS)
+            return True
+        except Exception:
+            # Already taken (or storage is down): break it only if it is stale
+            pass
+        objects = call("storage", storage.list_sync, SWEEP_LEASE_DIR, search=SWEEP_LEASE_NAME, native_timeout=timeout_kwarg) or []
+        lease = next((obj for obj in objects if obj.get("name") == SWEEP_LEASE_NAME), None)
+        if lease is not None:
+            acquired = _parse_timestamp(lease.get("updated_at") or lease.get("created_at"))
+            if acquired is not None and time.time() - acquired < interval_seconds:
+                return False
+            call("storage_write", storage.remove_sync, [lease_path], native_timeout=timeout_kwarg)
+    return False
+
+
+async def run_ttl_sweeper(
+    ttl_hours: float = DOCUMENT_TTL_HOURS,
+    interval_seconds: int = SWEEP_INTERVAL_SECONDS,
+):
+    """Background loop that expires unused documents until cancelled.
+
+    Every worker runs the loop, but only the one holding the sweep lease
+    for the current interval sweeps.
+    """
+    while True:
+        try:
+            if await asyncio.to_thread(_acquire_sweep_lease, interval_seconds):
+                await asyncio.to_thread(sweep_expired_documents, ttl_hours)
+        except Exception as e:  # noqa: BLE001
+            print(f"TTL sweep failed: {e}")
+        await asyncio.sleep(interval_seconds)
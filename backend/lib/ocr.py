@@ -1,12 +1,18 @@
 import json
 import os
+import threading
+import time
 import uuid
-from supabase import create_client, Client
 from dotenv import load_dotenv
 from google.api_core.client_options import ClientOptions
-from typing import Optional
+from typing import List, Optional
 from google.cloud import documentai  # type: ignore
 from google.cloud.documentai_v1.types import Document
+from .index_lifecycle import touch_document
+from .deadline import call, timeout_kwarg
+from .ocr_index import lookup_ocr, record_ocr, upload_hash
+from .storage import storage
+from .pdf_text import NATIVE_PDF_TEXT, TEXT_LAYER_VERSION, build_document_json, extract_page_texts, is_pdf
 
 load_dotenv()  # Load environment variables from .env file
 # Simplified hardened sample for processing a local PDF with Document AI.
@@ -20,39 +26,67 @@ mime_type = "application/pdf"  # Refer to supported file types doc
 # Optional overrides (explicitly defined to avoid NameError)
 field_mask: Optional[str] = None  # e.g. "text,entities,pages.pageNumber"
 processor_version_id: Optional[str] = None  # e.g. "YOUR_PROCESSOR_VERSION_ID"
+# How long a resolved default processor version is trusted before asking again
+PROCESSOR_VERSION_TTL_SECONDS = 3600
 
-# Initialize Supabase client
-url: str = os.environ.get("SUPABASE_URL")
-key: str = os.environ.get("SUPABASE_KEY")
-supabase: Client = create_client(url, key)
+_resolved_version: Optional[str] = None
+_resolved_at = 0.0
+_version_lock = threading.Lock()
 
-def process_document_sample(
-    file_path: str,
-) -> dict:
-    """Process a local document file with Document AI and return recognized text.
-
-    Args:
-        file_path: Absolute or relative path to the document (PDF/image).
 
-    Returns:
-        Extracted plain text from the processed document.
-    """
+def _client() -> documentai.DocumentProcessorServiceClient:
     # You must set the `api_endpoint` if you use a location other than "us".
     opts = ClientOptions(api_endpoint=f"{location}-documentai.googleapis.com")
+    return documentai.DocumentProcessorServiceClient(client_options=opts)
+
 
-    client = documentai.DocumentProcessorServiceClient(client_options=opts)
+def resolve_processor_version() -> Optional[str]:
+    """The processor version id OCR runs with, or None if it cannot be resolved.
 
+    `processor_version_id` when set; otherwise the processor's current
+    default version, looked up at most every PROCESSOR_VERSION_TTL_SECONDS
+    so a changed default is picked up (and changes the OCR dedup key).
+    """
+    global _resolved_version, _resolved_at
     if processor_version_id:
+        return processor_version_id
+    with _version_lock:
+        if _resolved_version and time.monotonic() - _resolved_at < PROCESSOR_VERSION_TTL_SECONDS:
+            return _resolved_version
+    try:
+        client = _client()
+        processor = call(
+            "document_ai", client.get_processor,
+            name=client.processor_path(project_id, location, processor_id),
+            native_timeout=timeout_kwarg,
+        )
+    except Exception as e:  # noqa: BLE001
+        print(f"Could not resolve the Document AI processor version: {e}")
+        return None
+    # e.g. projects/p/locations/us/processors/id/processorVersions/pretrained-ocr-v2.0-2023-06-02
+    version = processor.default_processor_version.rsplit("/", 1)[-1] or None
+    with _version_lock:
+        _resolved_version, _resolved_at = version, time.monotonic()
+    return version
+
+
+def _run_document_ai(image_content: bytes, pages: Optional[List[int]] = None, version: Optional[str] = None) -> dict:
+    """Run Document AI OCR and return the Document as a JSON dict.
+
+    Args:
+        image_content: The document bytes.
+        pages: 1-based page numbers to process (all pages when None).
+        version: Processor version to pin (the processor's default when None).
+    """
+    client = _client()
+
+    if version:
         name = client.processor_version_path(
-            project_id, location, processor_id, processor_version_id
+            project_id, location, processor_id, version
         )
     else:
         name = client.processor_path(project_id, location, processor_id)
 
-    # Read the file into memory
-    with open(file_path, "rb") as image:
-        image_content = image.read()
-
     # Load binary data
     raw_document = documentai.RawDocument(content=image_content, mime_type=mime_type)
 
@@ -63,6 +97,8 @@ def process_document_sample(
             enable_native_pdf_parsing=True
         ),
     )
+    if pages:
+        process_options.individual_page_selector = documentai.ProcessOptions.IndividualPageSelector(pages=pages)
 
     # Configure the process request
     request_kwargs = {
@@ -74,34 +110,89 @@ def process_document_sample(
         request_kwargs["field_mask"] = field_mask
     request = documentai.ProcessRequest(**request_kwargs)
 
-    result = client.process_document(request=request)
+    result = call("document_ai", client.process_document, request=request, native_timeout=timeout_kwarg)
 
     # For a full list of `Document` object attributes, reference this page:
     # https://cloud.google.com/document-ai/docs/reference/rest/v1/Document
     document = result.document
 
     document = Document.to_json(document)
-    document = json.loads(document)
+    return json.loads(document)
+
+
+def process_document_sample(
+    file_path: str,
+    owner: Optional[str] = None,
+) -> dict:
+    """Process a local document file with Document AI and return recognized text.
+
+    Identical bytes already processed for the same authenticated owner by
+    the same processor version are not sent again; the existing OCR
+    artifact URL is returned instead. Pages of a PDF with a usable text layer are read
+    locally, and only the remaining pages are sent to Document AI.
+
+    Args:
+        file_path: Absolute or relative path to the document (PDF/image).
+        owner: Authenticated user the document belongs to. Without one,
+            uploads are never deduplicated.
+
+    Returns:
+        Extracted plain text from the processed document.
+    """
+    # Read the file into memory
+    with open(file_path, "rb") as image:
+        image_content = image.read()
+
+    # Skip Document AI for a repeat upload of the same file by the same owner.
+    # Without an authenticated owner or a resolved version there is no safe
+    # key, so nothing is reused.
+    content_sha = upload_hash(image_content)
+    version = resolve_processor_version()
+    processor_key = None
+    if version and owner:
+        processor_key = f"{processor_id}-{version}"
+        if NATIVE_PDF_TEXT:
+            processor_key += f"-text{TEXT_LAYER_VERSION}"
+        existing = lookup_ocr(content_sha, processor_key, owner)
+        if existing:
+            touch_document(existing["file_path"])
+            return {"url": existing["url"]}
+
+    # Born-digital PDFs: use the embedded text layer, OCR only scanned pages
+    document = None
+    page_texts = extract_page_texts(image_content) if NATIVE_PDF_TEXT and is_pdf(image_content) else None
+    if page_texts and any(text is not None for text in page_texts):
+        ocr_pages = [number for number, text in enumerate(page_texts, start=1) if text is None]
+        ocr_document = _run_document_ai(image_content, pages=ocr_pages, version=version) if ocr_pages else None
+        document = build_document_json(page_texts, ocr_document)
+    if document is None:
+        document = _run_document_ai(image_content, version=version)
 
     # push file to supabase
     file_path = f"ocr/{str(uuid.uuid4())}.json"
-    response  = (
-        supabase.storage
-        .from_("ocr_bucket")
-        .upload(
-            path=file_path,
-            file = json.dumps(document).encode('utf-8'),
-        )
+    # upsert so a retried upload after a timeout does not fail as a duplicate
+    response  = call(
+        "storage_write",
+        storage.upload_sync,
+        file_path,
+        json.dumps(document).encode('utf-8'),
+        native_timeout=timeout_kwarg,
     )
     
     #get public url
-    public_url = (
-        supabase.storage
-        .from_("ocr_bucket")
-        .get_public_url(file_path)
-    )
+    public_url = storage.public_url(file_path)
     print("File uploaded to Supabase Storage.")
 
+    # best effort: a failed index write only means the next identical upload is OCR'd again
+    if processor_key:
+        try:
+            record_ocr(content_sha, processor_key, owner, file_path, public_url)
+        except Exception as e:
+            print(f"Could not record OCR index entry: {e}")
+
+    # register in the ingestion registry so unused documents can expire
+    touch_document(file_path)
+
     return {"url" : public_url}
     
 
@@ -0,0 +1,59 @@
+import hashlib
+import json
+from dotenv import load_dotenv
+from typing import List, Optional
+
+from .deadline import call, timeout_kwarg
+from .storage import storage
+
+load_dotenv()
+
+
+def upload_hash(content: bytes) -> str:
+    """SHA-256 of the uploaded file bytes."""
+    return hashlib.sha256(content).hexdigest()
+
+
+def _index_path(content_sha: str, processor_key: str, owner: str) -> str:
+    # Scoped per owner: one user deleting (or expiring) their copy must not
+    # remove a document another user uploaded with the same bytes
+    owner_key = hashlib.sha256(owner.encode("utf-8")).hexdigest()[:16]
+    return f"ocr_index/{content_sha}/{owner_key}/{processor_key}.json"
+
+
+def _document_path(document_id: str) -> str:
+    # Reverse pointer so deleting a document also drops its index entry
+    return f"ocr_index/documents/{document_id}.json"
+
+
+def lookup_ocr(content_sha: str, processor_key: str, owner: str) -> Optional[dict]:
+    """Return {"url", "file_path"} of `owner`'s existing OCR artifact, or None."""
+    try:
+        response = call("storage", storage.download_sync, _index_path(content_sha, processor_key, owner), native_timeout=timeout_kwarg)
+    except Exception:
+        return None
+    return json.loads(response)
+
+
+def record_ocr(content_sha: str, processor_key: str, owner: str, file_path: str, public_url: str):
+    """Remember which OCR artifact was produced for `owner`'s bytes and processor."""
+    index_path = _index_path(content_sha, processor_key, owner)
+    document_id = file_path[5:-5:]
+    for path, entry in (
+        (index_path, {"url": public_url, "file_path": file_path}),
+        (_document_path(document_id), {"index_path": index_path}),
+    ):
+        call(
+            "storage_write", storage.upload_sync, path,
+            json.dumps(entry).encode("utf-8"),
+            native_timeout=timeout_kwarg,
+        )
+
+
+def ocr_index_paths(document_id: str) -> List[str]:
+    """Storage paths of a document's OCR index entries (for deletion)."""
+    try:
+        response = call("storage", storage.download_sync, _document_path(document_id), native_timeout=timeout_kwarg)
+    except Exception:
+        return []
+    return [json.loads(response)["index_path"], _document_path(document_id)]
@@ -0,0 +1,151 @@
+import io
+import os
+import re
+from dotenv import load_dotenv
+from typing import Any, Dict, List, Optional
+
+load_dotenv()
+
+try:
+    from pypdf import PdfReader
+    PYPDF_AVAILABLE = True
+except ImportError:
+    PYPDF_AVAILABLE = False
+
+# Read the embedded text layer of born-digital PDFs instead of running OCR
+NATIVE_PDF_TEXT = os.getenv("NATIVE_PDF_TEXT", "true").lower() == "true"
+# A page needs at least this many letters/digits to count as having a text layer
+MIN_TEXT_LAYER_CHARS = int(os.getenv("MIN_TEXT_LAYER_CHARS", "40"))
+# Bump when extraction or paragraph splitting changes (part of the OCR dedup key)
+TEXT_LAYER_VERSION = "1"
+
+_SENTENCE_END = re.compile(r"[.:;!?)\"']\s*$")
+_LIST_START = re.compile(r"^\s*(\(?[0-9ivxIVX]+[.)]|\(?[a-zA-Z][.)]|[-•*])\s+")
+
+
+def is_pdf(content: bytes) -> bool:
+    return content[:1024].lstrip().startswith(b"%PDF-")
+
+
+def _usable(text: str) -> bool:
+    """True when extracted page text looks like real text, not an empty or garbled layer."""
+    alnum = sum(ch.isalnum() for ch in text)
+    if alnum < MIN_TEXT_LAYER_CHARS:
+        return False
+    # Fonts without a Unicode map come out as replacement chars or (cid:N) runs
+    garbled = text.count("\ufffd") + 5 * text.count("(cid:")
+    return garbled < 0.05 * len(text)
+
+
+def extract_page_texts(content: bytes) -> Optional[List[Optional[str]]]:
+    """Per-page text from a PDF's text layer; None for pages that need OCR.
+
+    Returns None when the file cannot be read locally (pypdf missing,
+    encrypted or malformed PDF), in which case the whole file goes to OCR.
+    """
+    if not PYPDF_AVAILABLE:
+        return None
+    try:
+        reader = PdfReader(io.BytesIO(content))
+        if reader.is_encrypted:
+            return None
+        texts: List[Optional[str]] = []
+        for page in reader.pages:
+            text = page.extract_text() or ""
+            texts.append(text if _usable(text) else None)
+        return texts
+    except Exception as e:  # noqa: BLE001
+        print(f"Text layer extraction failed, using OCR: {e}")
+        return None
+
+
+def split_paragraphs(page_text: str) -> List[str]:
+    """Split one page of text-layer output into paragraphs.
+
+    Blank lines always separate paragraphs. Within a block, a line that ends
+    a sentence and is clearly shorter than the block's full lines ends a
+    paragraph, and numbered or bulleted lines start a new one.
+    """
+    paragraphs: List[str] = []
+    for block in re.split(r"\n\s*\n", page_text):
+        lines = [re.sub(r"\s+", " ", line).strip() for line in block.splitlines()]
+        lines = [line for line in lines if line]
+        if not lines:
+            continue
+        full_width = max(len(line) for line in lines)
+        current: List[str] = []
+        for line in lines:
+            if current and _LIST_START.match(line):
+                paragraphs.append(" ".join(current))
+                current = []
+            current.append(line)
+            if _SENTENCE_END.search(line) and len(line) < 0.8 * full_width:
+                paragraphs.append(" ".join(current))
+                current = []
+        if current:
+            paragraphs.append(" ".join(current))
+    return paragraphs
+
+
+def _segment(start: int, end: int) -> Dict[str, Any]:
+    # Document AI JSON encodes int64 offsets as strings
+    return {"textAnchor": {"textSegments": [{"startIndex": str(start), "endIndex": str(end)}]}}
+
+
+def _shift_anchors(node: Any, delta: int):
+    """Move every textAnchor offset in a (page) subtree by `delta` characters."""
+    if isinstance(node, dict):
+        for segment in node.get("textAnchor", {}).get("textSegments", []):
+            segment["startIndex"] = str(int(segment.get("startIndex", 0)) + delta)
+            segment["endIndex"] = str(int(segment.get("endIndex", 0)) + delta)
+        for key, value in node.items():
+            if key != "textAnchor":
+                _shift_anchors(value, delta)
+    elif isinstance(node, list):
+        for item in node:
+            _shift_anchors(item, delta)
+
+
+def build_document_json(page_texts: List[Optional[str]], ocr_document: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Assemble a Document-AI-shaped JSON from text-layer pages and OCR'd pages.
+
+    `page_texts` holds one entry per PDF page (None = no text layer).
+    `ocr_document` is the Document AI result for exactly the None pages, in
+    order; its pages are spliced in with their offsets moved to the merged
+    `text`. The result has the `text` and `pages[].paragraphs[].layout`
+    fields `create_chunks_from_doc_ai_json` reads.
+    """
+    ocr_pages = list((ocr_document or {}).get("pages", []))
+    ocr_text = (ocr_document or {}).get("text", "")
+    text_parts: List[str] = []
+    offset = 0
+    pages: List[Dict[str, Any]] = []
+    for page_number, page_text in enumerate(page_texts, start=1):
+        page_start = offset
+        if page_text is not None:
+            paragraphs = []
+            for paragraph in split_paragraphs(page_text):
+                start = offset
+                text_parts.append(paragraph + "\n")
+                offset += len(paragraph) + 1
+                paragraphs.append({"layout": _segment(start, offset)})
+            pages.append({"pageNumber": page_number, "layout": _segment(page_start, offset), "paragraphs": paragraphs})
+            continue
+
+        if not ocr_pages:
+            pages.append({"pageNumber": page_number, "layout": _segment(offset, offset), "paragraphs": []})
+            continue
+        page = ocr_pages.pop(0)
+        segments = page.get("layout", {}).get("textAnchor", {}).get("textSegments", [])
+        if segments:
+            src_start = int(segments[0].get("startIndex", 0))
+            src_end = int(segments[-1].get("endIndex", 0))
+        else:
+            src_start = src_end = 0
+        text_parts.append(ocr_text[src_start:src_end])
+        _shift_anchors(page, offset - src_start)
+        offset += src_end - src_start
+        page["pageNumber"] = page_number
+        pages.append(page)
+
+    return {"mimeType": "application/pdf", "text": "".join(text_parts), "pages": pages}
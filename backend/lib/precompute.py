@@ -0,0 +1,44 @@
+import asyncio
+import os
+from dotenv import load_dotenv
+
+from .deadline import INGEST_DEADLINE_SECONDS, deadline_scope
+from .get_risk import get_risk_statments
+from .get_summary import compute_summary, index_document
+from .single_flight import coalescer, document_key
+from .scheduler import ANALYSIS, INGESTION, priority_scope
+
+load_dotenv()
+
+# Run indexing, summary and risk extraction right after upload
+PRECOMPUTE_ON_UPLOAD = os.getenv("PRECOMPUTE_ON_UPLOAD", "true").lower() == "true"
+
+
+async def precompute_analysis(file_path: str):
+    """Index a newly uploaded document and store its summary and risk results.
+
+    Each stage runs under the same single-flight key as the matching
+    endpoint, so a /get_summary or /get_risk call made right after upload
+    joins the precompute (or the precompute joins it) instead of paying for
+    the work twice. Indexing runs first so the risk result is computed with
+    embedding evidence and can be stored. A failed stage is logged and the
+    matching endpoint computes the result on demand instead.
+
+    Indexing runs at ingestion priority. Summary and risk run at analysis
+    priority, the class of the endpoints that join them, so a user waiting
+    on a shared call is never queued behind bulk work.
+    """
+    bucket_file_path = document_key(file_path)
+    stages = (
+        ("index", ("create_rag", bucket_file_path), index_document, INGESTION),
+        ("summary", ("get_summary", bucket_file_path), compute_summary, ANALYSIS),
+        ("risk", ("get_risk", bucket_file_path), get_risk_statments, ANALYSIS),
+    )
+    # Runs after the upload response, so it gets its own budget
+    with deadline_scope(INGEST_DEADLINE_SECONDS, inherit=False):
+        for name, key, stage, priority in stages:
+            try:
+                with priority_scope(priority):
+                    await coalescer.do(key, lambda stage=stage: asyncio.to_thread(stage, bucket_file_path))
+            except Exception as e:  # noqa: BLE001
+                print(f"Precompute {name} failed for {bucket_file_path}: {e}")
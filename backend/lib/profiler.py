@@ -0,0 +1,222 @@
+import contextvars
+import functools
+import hmac
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from typing import Any, Callable, Dict, List, Optional, TypeVar
+
+load_dotenv()
+
+T = TypeVar("T")
+
+# Needed in X-Admin-Token for on-demand profiles and the /debug/profiles endpoints (unset = disabled)
+PROFILER_ADMIN_TOKEN = os.getenv("PROFILER_ADMIN_TOKEN", "")
+# Profile every request and keep the ones slower than this (0 = off)
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "10"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "demystdocs_profiles"))
+# Ring buffer size: the oldest profiles are deleted beyond this count
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "50"))
+MAX_STACK_DEPTH = 64
+
+_PROFILE_ID = re.compile(r"^[0-9a-f]{12}$")
+
+
+class Profile:
+    """Stack samples collected for one request."""
+
+    def __init__(self, label: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.label = label
+        self.started_at = time.time()
+        self.started = time.monotonic()
+        self.duration = 0.0
+        self.finished = False
+        self.samples = 0
+        self.stacks: Counter = Counter()
+
+    def to_dict(self, reason: str, status: Optional[int] = None) -> Dict[str, Any]:
+        # Self time per function: the leaf frame of each sampled stack
+        leaves: Counter = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        return {
+            "id": self.id,
+            "label": self.label,
+            "reason": reason,
+            "status": status,
+            "started_at": self.started_at,
+            "duration_ms": round(1000 * self.duration, 1),
+            "interval_ms": PROFILE_INTERVAL_MS,
+            "samples": self.samples,
+            "top": [{"frame": frame, "samples": count} for frame, count in leaves.most_common(20)],
+            "stacks": dict(self.stacks),
+        }
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Wall-clock sampling profiler for individual requests.
+
+    A single daemon thread wakes every `interval_ms` while any profile is
+    active and records the stacks (`sys._current_frames`) of the threads
+    working for that request. Work is attributed by running it through
+    `tracked(fn)` in whichever thread it lands on; code outside tracked
+    functions (including the event loop itself) is not sampled. Stacks are
+    stored in folded form ("outer;inner;leaf" -> samples), ready for
+    flame graph tools.
+    """
+
+    def __init__(self, profile_dir: str = PROFILE_DIR, max_files: int = PROFILE_MAX_FILES, interval_ms: float = PROFILE_INTERVAL_MS):
+        self.profile_dir = profile_dir
+        self.max_files = max_files
+        self.interval = interval_ms / 1000.0
+        self._current: contextvars.ContextVar[Optional[Profile]] = contextvars.ContextVar("profile", default=None)
+        # thread id -> profile it is working for
+        self._threads: Dict[int, Profile] = {}
+        self._active = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    # --- collection ---
+    @contextmanager
+    def profile(self, label: str):
+        """Profile the enclosed work and the tracked threads it starts."""
+        prof = Profile(label)
+        token = self._current.set(prof)
+        with self._lock:
+            self._active += 1
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._run, name="profiler", daemon=True)
+                self._sampler.start()
+        self._wake.set()
+        try:
+            yield prof
+        finally:
+            prof.duration = time.monotonic() - prof.started
+            self._current.reset(token)
+            with self._lock:
+                # Tracked threads still running (e.g. background indexing) stop counting here
+                prof.finished = True
+                self._active -= 1
+
+    def tracked(self, fn: Callable[..., T]) -> Callable[..., T]:
+        """Wrap `fn` so the thread running it is sampled for the caller's profile."""
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            prof = self._current.get()
+            if prof is None:
+                return fn(*args, **kwargs)
+            ident = threading.get_ident()
+            with self._lock:
+                previous = self._threads.get(ident)
+                self._threads[ident] = prof
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    if previous is None:
+                        self._threads.pop(ident, None)
+                    else:
+                        self._threads[ident] = previous
+        return wrapper
+
+    def _run(self):
+        while True:
+            with self._lock:
+                idle = self._active == 0
+                if idle:
+                    self._wake.clear()
+            if idle:
+                self._wake.wait()
+                continue
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, prof in self._threads.items():
+                    frame = frames.get(ident)
+                    if frame is None or prof.finished:
+                        continue
+                    stack: List[str] = []
+                    while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                        stack.append(_frame_label(frame))
+                        frame = frame.f_back
+                    prof.stacks[";".join(reversed(stack))] += 1
+                    prof.samples += 1
+
+    # --- ring buffer on disk ---
+    def save(self, prof: Profile, reason: str, status: Optional[int] = None) -> str:
+        os.makedirs(self.profile_dir, exist_ok=True)
+        target = os.path.join(self.profile_dir, f"{time.time_ns()}-{prof.id}.json")
+        # Write-then-rename so a listing never sees a partial profile
+        fd, tmp = tempfile.mkstemp(dir=self.profile_dir, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(prof.to_dict(reason, status), f)
+        os.replace(tmp, target)
+        files = self._files()
+        for stale in files[:max(0, len(files) - self.max_files)]:
+            try:
+                os.remove(os.path.join(self.profile_dir, stale))
+            except OSError:
+                pass
+        return prof.id
+
+    def _files(self) -> List[str]:
+        try:
+            return sorted(name for name in os.listdir(self.profile_dir) if name.endswith(".json"))
+        except OSError:
+            return []
+
+    def list_profiles(self) -> List[Dict[str, Any]]:
+        """Metadata of stored profiles, newest first."""
+        profiles = []
+        for name in reversed(self._files()):
+            try:
+                with open(os.path.join(self.profile_dir, name), "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            data.pop("stacks", None)
+            data.pop("top", None)
+            profiles.append(data)
+        return profiles
+
+    def load_profile(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        if not _PROFILE_ID.match(profile_id):
+            return None
+        for name in self._files():
+            if name.endswith(f"-{profile_id}.json"):
+                try:
+                    with open(os.path.join(self.profile_dir, name), "r", encoding="utf-8") as f:
+                        return json.load(f)
+                except (OSError, ValueError):
+                    return None
+        return None
+
+
+def is_admin(token: Optional[str]) -> bool:
+    """True when profiling is enabled and `token` matches PROFILER_ADMIN_TOKEN."""
+    return bool(PROFILER_ADMIN_TOKEN) and hmac.compare_digest(token or "", PROFILER_ADMIN_TOKEN)
+
+
+def folded(profile: Dict[str, Any]) -> str:
+    """Render stored stacks in the folded format flame graph tools read."""
+    return "".join(f"{stack} {count}\n" for stack, count in profile.get("stacks", {}).items())
+
+
+# Shared by every lib module in this worker
+profiler = SamplingProfiler()
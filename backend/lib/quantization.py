@@ -0,0 +1,300 @@
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .chunk_store import ChunkSet
+
+load_dotenv()
+
+# "none" keeps using Vertex AI Vector Search only; "int8" or "pq" also keeps a
+# compressed copy of each indexed document resident for local retrieval
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none")
+# Product quantization: sub-vectors per vector and centroids per sub-space
+PQ_SUBVECTORS = int(os.getenv("PQ_SUBVECTORS", "96"))
+PQ_CENTROIDS = 256
+PQ_ITERATIONS = 15
+# Vectors pooled across documents for training the shared PQ codebook
+PQ_TRAIN_SAMPLE = 4096
+# Candidates scored on the codes per returned neighbor, before exact re-ranking
+RERANK_FACTOR = 4
+# Resident budget for compressed codes across all documents
+RESIDENT_MAX_BYTES = int(os.getenv("RESIDENT_MAX_BYTES", str(512 * 1024 * 1024)))
+# Full-precision vectors are spilled here and memory-mapped for re-ranking
+VECTOR_SPILL_DIR = os.getenv("VECTOR_SPILL_DIR", os.path.join(tempfile.gettempdir(), "demystdocs_vectors"))
+
+
+class Int8Quantizer:
+    """Symmetric per-dimension scalar quantization to int8 (4x smaller)."""
+
+    def fit(self, vectors: np.ndarray) -> "Int8Quantizer":
+        self.scale = np.abs(vectors).max(axis=0).astype(np.float32) / 127
+        self.scale[self.scale == 0] = 1.0
+        return self
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.clip(np.rint(vectors / self.scale), -127, 127).astype(np.int8)
+
+    def scores(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        # dot(code * scale, q) == dot(code, q * scale)
+        return codes @ (query * self.scale).astype(np.float32)
+
+    def nbytes(self) -> int:
+        return self.scale.nbytes
+
+
+class ProductQuantizer:
+    """Product quantization: one uint8 centroid id per sub-vector."""
+
+    def __init__(self, subvectors: int = PQ_SUBVECTORS, centroids: int = PQ_CENTROIDS, iterations: int = PQ_ITERATIONS):
+        self.subvectors = subvectors
+        self.centroids = centroids
+        self.iterations = iterations
+
+    def fit(self, vectors: np.ndarray) -> "ProductQuantizer":
+        n, dim = vectors.shape
+        if dim % self.subvectors:
+            raise ValueError(f"dimension {dim} is not divisible by {self.subvectors} sub-vectors")
+        self.sub_dim = dim // self.subvectors
+        k = min(self.centroids, n)
+        rng = np.random.default_rng(0)
+        self.codebooks = np.empty((self.subvectors, k, self.sub_dim), dtype=np.float32)
+        for j in range(self.subvectors):
+            sub = vectors[:, j * self.sub_dim:(j + 1) * self.sub_dim]
+            centers = sub[rng.choice(n, k, replace=False)].copy()
+            for _ in range(self.iterations):
+                assign = self._nearest(sub, centers)
+                sums = np.zeros_like(centers)
+                np.add.at(sums, assign, sub)
+                counts = np.bincount(assign, minlength=k)
+                filled = counts > 0
+                centers[filled] = sums[filled] / counts[filled, None]
+            self.codebooks[j] = centers
+        return self
+
+    @staticmethod
+    def _nearest(sub: np.ndarray, centers: np.ndarray) -> np.ndarray:
+        distances = (sub ** 2).sum(axis=1)[:, None] - 2 * sub @ centers.T + (centers ** 2).sum(axis=1)[None, :]
+        return distances.argmin(axis=1)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        codes = np.empty((len(vectors), self.subvectors), dtype=np.uint8)
+        for j in range(self.subvectors):
+            sub = vectors[:, j * self.sub_dim:(j + 1) * self.sub_dim]
+            codes[:, j] = self._nearest(sub, self.codebooks[j])
+        return codes
+
+    def scores(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        # Asymmetric distance: look up each sub-vector's dot product in a table
+        table = np.einsum("jkd,jd->jk", self.codebooks, query.reshape(self.subvectors, self.sub_dim))
+        return table[np.arange(self.subvectors), codes].sum(axis=1)
+
+    def nbytes(self) -> int:
+        return self.codebooks.nbytes
+
+
+def _make_quantizer(mode: str):
+    if mode == "int8":
+        return Int8Quantizer()
+    if mode == "pq":
+        return ProductQuantizer()
+    raise ValueError(f"Unknown quantization mode: {mode}")
+
+
+class QuantizedIndex:
+    """Searches compressed codes, then re-ranks the best candidates exactly.
+
+    The float32 vectors are written to `spill_path` and memory-mapped, so
+    re-ranking only pages in the few rows it reads. Without a path they are
+    kept as given (useful for evaluation).
+    """
+
+    def __init__(self, vectors: np.ndarray, mode: str = "int8", spill_path: Optional[str] = None, quantizer=None):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self.mode = mode
+        self.shared_quantizer = quantizer is not None
+        self.quantizer = quantizer if quantizer is not None else _make_quantizer(mode).fit(vectors)
+        self.codes = self.quantizer.encode(vectors)
+        if spill_path:
+            # Never truncate a file another index (or worker) may have mapped:
+            # fill a fresh file, map it, then rename it into place. Existing
+            # mappings keep the old file's pages until they are dropped.
+            spill_dir = os.path.dirname(spill_path)
+            os.makedirs(spill_dir, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=spill_dir, suffix=".tmp")
+            os.close(fd)
+            try:
+                exact = np.memmap(tmp, dtype=np.float32, mode="w+", shape=vectors.shape)
+                exact[:] = vectors
+                exact.flush()
+                del exact
+                self.exact = np.memmap(tmp, dtype=np.float32, mode="r", shape=vectors.shape)
+                os.replace(tmp, spill_path)
+            except BaseException:
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+                raise
+        else:
+            self.exact = vectors
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def search(self, query, k: int, rerank_factor: int = RERANK_FACTOR) -> List[Tuple[int, float]]:
+        """Top-k (row, score) pairs by dot product. `rerank_factor=0` skips re-ranking."""
+        query = np.asarray(query, dtype=np.float32)
+        k = min(k, len(self))
+        if k == 0:
+            return []
+        approx = self.quantizer.scores(self.codes, query)
+        if not rerank_factor:
+            top = np.argsort(-approx)[:k]
+            return [(int(i), float(approx[i])) for i in top]
+
+        n_candidates = min(len(self), k * rerank_factor)
+        candidates = np.argpartition(-approx, n_candidates - 1)[:n_candidates]
+        candidates.sort()  # sequential reads from the memory map
+        exact = np.asarray(self.exact[candidates]) @ query
+        order = np.argsort(-exact)[:k]
+        return [(int(candidates[i]), float(exact[i])) for i in order]
+
+    def nbytes(self) -> int:
+        """Resident bytes: the codes plus any quantizer parameters it owns."""
+        return self.codes.nbytes + (0 if self.shared_quantizer else self.quantizer.nbytes())
+
+
+def evaluate_quantization(vectors: np.ndarray, queries: Optional[np.ndarray] = None, k: int = 10, mode: str = "int8") -> Dict[str, float]:
+    """Recall@k and memory of quantized search against exact search.
+
+    Args:
+        vectors: float matrix of document vectors.
+        queries: query vectors; defaults to up to 100 of the document vectors.
+        k: number of neighbors compared.
+        mode: "int8" or "pq".
+    Returns:
+        Recall on codes alone and after re-ranking, plus float and
+        quantized memory in bytes.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if queries is None:
+        queries = vectors[np.random.default_rng(0).choice(len(vectors), min(100, len(vectors)), replace=False)]
+    index = QuantizedIndex(vectors, mode)
+    k = min(k, len(vectors))
+
+    recall_codes = recall_rerank = 0.0
+    for query in np.asarray(queries, dtype=np.float32):
+        truth = set(np.argsort(-(vectors @ query))[:k].tolist())
+        recall_codes += len(truth & {i for i, _ in index.search(query, k, rerank_factor=0)}) / k
+        recall_rerank += len(truth & {i for i, _ in index.search(query, k)}) / k
+
+    return {
+        "mode": mode,
+        "k": k,
+        f"recall@{k}_codes": recall_codes / len(queries),
+        f"recall@{k}_reranked": recall_rerank / len(queries),
+        "float_bytes": vectors.nbytes,
+        "quantized_bytes": index.nbytes(),
+        "compression": vectors.nbytes / max(1, index.nbytes()),
+    }
+
+
+# --- Resident per-document indexes (LRU within RESIDENT_MAX_BYTES) ---
+_resident: "OrderedDict[str, Tuple[QuantizedIndex, List[str]]]" = OrderedDict()
+_resident_lock = threading.Lock()
+# PQ codebooks are about 256 x dim floats, too large to keep per document,
+# so one codebook is shared. It is trained on vectors pooled from several
+# documents, since most leases have fewer than PQ_CENTROIDS chunks.
+_shared_pq: Optional[ProductQuantizer] = None
+_pq_sample: List[np.ndarray] = []
+_pq_lock = threading.Lock()
+
+
+def _pq_quantizer(vectors: np.ndarray) -> Optional[ProductQuantizer]:
+    """The shared codebook, training it once enough vectors were pooled."""
+    global _shared_pq
+    with _pq_lock:
+        if _shared_pq is not None:
+            return _shared_pq
+        _pq_sample.append(np.asarray(vectors, dtype=np.float32))
+        pooled = np.concatenate(_pq_sample)
+        if len(pooled) < PQ_CENTROIDS:
+            return None
+        if len(pooled) > PQ_TRAIN_SAMPLE:
+            pooled = pooled[np.random.default_rng(0).choice(len(pooled), PQ_TRAIN_SAMPLE, replace=False)]
+        _shared_pq = ProductQuantizer().fit(pooled)
+        _pq_sample.clear()
+        return _shared_pq
+
+
+def resident_state(document_id: str) -> Optional[Tuple[str, frozenset]]:
+    """(mode, chunk ids) of a resident document, or None if not resident."""
+    with _resident_lock:
+        entry = _resident.get(document_id)
+    if entry is None:
+        return None
+    index, ids = entry
+    return index.mode, frozenset(ids)
+
+
+def make_resident(chunk_set: ChunkSet, mode: str = VECTOR_QUANTIZATION):
+    """Quantize a document's indexed vectors and keep them for local search."""
+    if mode == "none" or chunk_set.vectors is None or not len(chunk_set):
+        return
+    quantizer = None
+    if mode == "pq":
+        quantizer = _pq_quantizer(chunk_set.vectors)
+        if quantizer is None:
+            with _pq_lock:
+                pooled = sum(len(v) for v in _pq_sample)
+            print(
+                f"PQ codebook not trained yet ({pooled}/{PQ_CENTROIDS} vectors pooled); "
+                f"keeping {chunk_set.document_id} resident as int8"
+            )
+            mode = "int8"
+    spill_path = os.path.join(VECTOR_SPILL_DIR, f"{chunk_set.document_id}.f32")
+    index = QuantizedIndex(chunk_set.vectors, mode, spill_path, quantizer)
+    with _resident_lock:
+        _resident[chunk_set.document_id] = (index, list(chunk_set.ids))
+        _resident.move_to_end(chunk_set.document_id)
+        while len(_resident) > 1 and sum(ix.nbytes() for ix, _ in _resident.values()) > RESIDENT_MAX_BYTES:
+            _evict(next(iter(_resident)))
+
+
+def _evict(document_id: str):
+    _resident.pop(document_id, None)
+    try:
+        os.remove(os.path.join(VECTOR_SPILL_DIR, f"{document_id}.f32"))
+    except OSError:
+        pass
+
+
+def drop_resident(document_id: str):
+    with _resident_lock:
+        _evict(document_id)
+
+
+def search_resident(document_id: str, query, k: int) -> Optional[List[Tuple[str, float]]]:
+    """Local top-k (chunk_id, score) for a resident document, else None."""
+    with _resident_lock:
+        entry = _resident.get(document_id)
+        if entry is None:
+            return None
+        _resident.move_to_end(document_id)
+    index, ids = entry
+    return [(ids[i], score) for i, score in index.search(query, k)]
+
+
+if __name__ == "__main__":
+    # Example usage: report recall@k and memory for a document's vectors
+    from .rag_builder import embed_text_chunks, load_chunk_set
+
+    file_path = "ocr/794bd64f-22ce-4840-af5b-2d7fe3f039c0.json"
+    embedded = embed_text_chunks(load_chunk_set(file_path, file_path[5:-5:]))
+    for mode in ("int8", "pq"):
+        print(evaluate_quantization(embedded.vectors, k=10, mode=mode))
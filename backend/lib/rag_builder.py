@@ -1,14 +1,22 @@
+import hashlib
 import json
 import os
+from datetime import datetime
 from dotenv import load_dotenv
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
+
+import numpy as np
 
 from google.cloud import aiplatform
 from google.cloud.aiplatform_v1beta1.types import FindNeighborsRequest, IndexDatapoint
 from google.cloud.aiplatform.matching_engine.matching_engine_index_endpoint import Namespace, NumericNamespace
 import google.generativeai as genai
 from vertexai.language_models import TextEmbeddingModel
-from supabase import create_client, Client
+from .chunk_store import ChunkSet
+from .storage import is_not_found, storage
+from .deadline import call, timeout_kwarg
+from .quantization import VECTOR_QUANTIZATION, make_resident, resident_state
+from .cache import cache
 
 load_dotenv()
 # --- 1. Configuration - Replace with your values ---
@@ -20,11 +28,9 @@ VECTOR_SEARCH_INDEX_ID = os.getenv("VECTOR_SEARCH_INDEX_ID")
 VECTOR_SEARCH_ENDPOINT_ID = os.getenv("VECTOR_SEARCH_ENDPOINT_ID")
 DEPLOYED_INDEX_ID=os.getenv("DEPLOYED_INDEX_ID")
 
-# Initialize Supabase client
-url: str = os.getenv("SUPABASE_URL")
-key: str = os.getenv("SUPABASE_KEY")
-bucket: str = os.getenv("SUPABASE_BUCKET")
-supabase: Client = create_client(url, key)
+# Documents uploaded before this time (ISO 8601, e.g. 2026-10-19T00:00:00Z)
+# may still have position-based datapoints; unset means none do
+LEGACY_CHUNK_IDS_BEFORE = os.getenv("LEGACY_CHUNK_IDS_BEFORE", "")
 
 
 # This will be the unique identifier for the document you're processing
@@ -38,6 +44,12 @@ MIN_CHUNK_WORDS = 5
 MAX_CONTEXT_CHUNKS = 10
 MIN_CONTEXT_CHUNKS = 5
 
+# Chunking mode: "paragraph" (one chunk per paragraph) or "structural"
+# (adjacent paragraphs and headings merged into token-sized windows)
+CHUNKING_MODE = os.getenv("CHUNKING_MODE", "paragraph")
+TARGET_CHUNK_TOKENS = int(os.getenv("TARGET_CHUNK_TOKENS", "300"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "0"))
+
 def _normalize_ws(text: str) -> str:
     return " ".join((text or "").split()).strip()
 
@@ -96,15 +108,94 @@ def get_text_from_layout(layout: dict, full_text: str) -> str:
         response += full_text[start_index:end_index]
     return response
 
+def _layout_segments(layout: dict) -> List[Tuple[int, int]]:
+    """
+    Returns the [start, end) offsets of a layout's text segments, in order.
+    Slicing and joining them gives exactly `get_text_from_layout`.
+    """
+    return [
+        (int(segment.get('startIndex', 0)), int(segment.get('endIndex', 0)))
+        for segment in layout.get('textAnchor', {}).get('textSegments', [])
+    ]
+
+def _merge_segments(segments: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """
+    Joins segments that continue exactly where the previous one ended.
+    """
+    merged: List[Tuple[int, int]] = []
+    for start, end in segments:
+        if merged and merged[-1][1] == start:
+            merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+def _chunk_offsets(segments: List[Tuple[int, int]]) -> Dict:
+    """
+    `start`/`end` bounds of a chunk plus its segments when not contiguous.
+    """
+    if not segments:
+        return {"start": 0, "end": 0}
+    offsets = {"start": segments[0][0], "end": segments[-1][1]}
+    if len(segments) > 1:
+        offsets["segments"] = segments
+    return offsets
+
+def _chunk_id(document_id: str, text: str) -> str:
+    """
+    Content-addressed datapoint id: the same text always maps to the same id,
+    so moved paragraphs keep their vectors and edits show up as new ids.
+    """
+    digest = hashlib.sha256(text.lower().encode("utf-8")).hexdigest()[:16]
+    return f"{document_id}_{digest}"
+
+def legacy_chunk_ids(doc_ai_json: dict, document_id: str) -> List[str]:
+    """
+    Position-based ids written before content-addressed ids were introduced.
+    """
+    return [
+        f"{document_id}_page_{page_num+1}_para_{paragraph_num+1}"
+        for page_num, page in enumerate(doc_ai_json.get('pages', []))
+        for paragraph_num, _ in enumerate(page.get('paragraphs', []))
+    ]
+
+def _parse_time(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+def may_have_legacy_ids(file_path: str) -> bool:
+    """
+    Whether the document was uploaded before LEGACY_CHUNK_IDS_BEFORE, so it
+    may have been indexed under `legacy_chunk_ids`. New uploads never are.
+    """
+    if not LEGACY_CHUNK_IDS_BEFORE:
+        return False
+    folder, _, name = file_path.rpartition("/")
+    objects = call("storage", storage.list_sync, folder, search=name, native_timeout=timeout_kwarg) or []
+    uploaded = next((obj.get("created_at") for obj in objects if obj.get("name") == name), None)
+    # Unknown upload time: clean up, an extra remove is harmless
+    return not uploaded or _parse_time(uploaded) < _parse_time(LEGACY_CHUNK_IDS_BEFORE)
+
+def load_doc_ai_json(file_path: str) -> dict:
+    """
+    Downloads a Document AI JSON response from the Supabase bucket.
+    """
+    response = call("storage", storage.download_sync, file_path, native_timeout=timeout_kwarg)
+    return json.loads(response)
+
 # --- Step 1: Chunking ---
-def create_chunks_from_doc_ai_json(file_path: str, DOCUMENT_ID: str) -> List[Dict]:
+def create_chunks_from_doc_ai_json(file_path: str, DOCUMENT_ID: str, doc_ai_json: Optional[dict] = None, mode: Optional[str] = None) -> List[Dict]:
     """
     Loads a Document AI JSON response and extracts paragraphs as text chunks.
+    Pass `doc_ai_json` when the caller already downloaded the document.
+    `mode` overrides CHUNKING_MODE.
     """
     #print("Step 1: Starting the chunking process...")
     
-    response = supabase.storage.from_(bucket).download(file_path)
-    doc_ai_json = json.loads(response)
+    if doc_ai_json is None:
+        doc_ai_json = load_doc_ai_json(file_path)
+
+    if (mode or CHUNKING_MODE) == "structural":
+        return create_structural_chunks(doc_ai_json, DOCUMENT_ID)
 
     full_text = doc_ai_json.get('text', '')
     chunks = []
@@ -117,62 +208,211 @@ def create_chunks_from_doc_ai_json(file_path: str, DOCUMENT_ID: str) -> List[Dic
             cleaned_text = _normalize_ws(paragraph_text)
 
             if cleaned_text and not _is_low_value(cleaned_text):
-                chunk_id = f"{DOCUMENT_ID}_page_{page_num+1}_para_{paragraph_num+1}"
+                chunk_id = _chunk_id(DOCUMENT_ID, cleaned_text)
                 chunks.append({
                     "id": chunk_id,
                     "text": cleaned_text,
                     "document_id": DOCUMENT_ID,
-                    "page_number": page_num + 1
+                    "page_number": page_num + 1,
+                    **_chunk_offsets(_merge_segments(_layout_segments(paragraph.get('layout', {})))),
                 })
     
     #print(f"-> Successfully created {len(chunks)} chunks.")
     return chunks
 
+def _text_paragraphs(doc_ai_json: dict) -> List[Dict]:
+    """
+    Reading-order paragraphs with their page, segments and normalized text,
+    dropping only empty or non-text noise.
+    """
+    full_text = doc_ai_json.get('text', '')
+    paragraphs = []
+    for page_num, page in enumerate(doc_ai_json.get('pages', [])):
+        for paragraph in page.get('paragraphs', []):
+            cleaned_text = _normalize_ws(get_text_from_layout(paragraph.get('layout', {}), full_text))
+            if cleaned_text and not _is_mostly_non_alpha(cleaned_text):
+                paragraphs.append({
+                    "page": page_num + 1,
+                    "segments": _layout_segments(paragraph.get('layout', {})),
+                    "text": cleaned_text,
+                })
+    return paragraphs
+
+def _estimate_tokens(text: str) -> int:
+    # Roughly 4 characters per token for English text
+    return max(1, len(text) // 4)
+
+def create_structural_chunks(
+    doc_ai_json: dict,
+    DOCUMENT_ID: str,
+    target_tokens: int = TARGET_CHUNK_TOKENS,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+    min_tokens: Optional[int] = None,
+) -> List[Dict]:
+    """
+    Merges adjacent paragraphs into windows of about `target_tokens`.
+
+    Headings and short clauses are kept and stay attached to the text that
+    follows them. Up to `overlap_tokens` of trailing paragraphs are repeated
+    at the start of the next window. A window adding fewer than `min_tokens`
+    (default a quarter of the target) of new text, such as a trailing
+    "Signed:" line, is merged into the previous window instead of becoming
+    its own chunk. Each chunk records the pages it spans.
+    """
+    if min_tokens is None:
+        min_tokens = target_tokens // 4
+    full_text = doc_ai_json.get('text', '')
+
+    paragraphs = _text_paragraphs(doc_ai_json)
+    for p in paragraphs:
+        p["tokens"] = _estimate_tokens(p["text"])
+        p["heading"] = _looks_like_heading(p["text"])
+
+    windows: List[List[Dict]] = []
+    window: List[Dict] = []
+    new_in_window = 0
+
+    def _flush(final: bool = False):
+        nonlocal window, new_in_window
+        # Trailing headings belong to the next window, not this one; after
+        # the last paragraph there is no next window, so they stay
+        carry = []
+        while not final and window and window[-1]["heading"] and len(window) > 1:
+            carry.insert(0, window.pop())
+        fresh = new_in_window - len(carry)
+        if fresh > 0:
+            if windows and sum(p["tokens"] for p in window[-fresh:]) < min_tokens:
+                # Too little new text for a chunk of its own
+                windows[-1].extend(p for p in window if not any(p is q for q in windows[-1]))
+            else:
+                windows.append(list(window))
+        # Seed the next window with the overlap
+        overlap: List[Dict] = []
+        budget = overlap_tokens
+        for p in reversed(window):
+            if p["heading"] or p["tokens"] > budget:
+                break
+            overlap.insert(0, p)
+            budget -= p["tokens"]
+        window = overlap + carry
+        new_in_window = len(carry)
+
+    for p in paragraphs:
+        window_tokens = sum(w["tokens"] for w in window)
+        # A window of only headings (and overlap) waits for the body they introduce
+        has_body = any(not w["heading"] for w in window[len(window) - new_in_window:])
+        if has_body and (
+            window_tokens + p["tokens"] > target_tokens
+            or (p["heading"] and window_tokens >= target_tokens // 2)
+        ):
+            _flush()
+        window.append(p)
+        new_in_window += 1
+    _flush(final=True)
+
+    chunks = []
+    for members in windows:
+        # Only the window's own paragraphs, so text between them that
+        # was filtered out (page numbers, noise) stays out
+        segments = _merge_segments([s for p in members for s in p["segments"]])
+        text = _normalize_ws("".join(full_text[s:e] for s, e in segments))
+        chunks.append({
+            "id": _chunk_id(DOCUMENT_ID, text),
+            "text": text,
+            "document_id": DOCUMENT_ID,
+            "page_number": members[0]["page"],
+            "page_start": members[0]["page"],
+            "page_end": members[-1]["page"],
+            "kind": "window",
+            **_chunk_offsets(segments),
+        })
+    return chunks
+
+def load_chunk_set(file_path: str, document_id: str, doc_ai_json: Optional[dict] = None, mode: Optional[str] = None) -> ChunkSet:
+    """
+    Chunks a Document AI JSON response straight into a compact ChunkSet.
+    """
+    if doc_ai_json is None:
+        doc_ai_json = load_doc_ai_json(file_path)
+    chunks = create_chunks_from_doc_ai_json(file_path, document_id, doc_ai_json, mode)
+    return ChunkSet.from_chunks(chunks, doc_ai_json.get('text', ''), document_id)
+
+def load_paragraph_set(file_path: str, document_id: str, doc_ai_json: Optional[dict] = None) -> ChunkSet:
+    """
+    Every text paragraph of a document as a ChunkSet, without the heading
+    and low-value filters applied for indexing, so numbered clauses such as
+    "12. The Tenant agrees to..." are kept.
+    """
+    if doc_ai_json is None:
+        doc_ai_json = load_doc_ai_json(file_path)
+    chunks = [
+        {
+            "id": _chunk_id(document_id, p["text"]),
+            "page_number": p["page"],
+            **_chunk_offsets(_merge_segments(p["segments"])),
+        }
+        for p in _text_paragraphs(doc_ai_json)
+    ]
+    return ChunkSet.from_chunks(chunks, doc_ai_json.get('text', ''), document_id)
+
 # --- Step 2: Embedding ---
-def embed_text_chunks(chunks: List[Dict]) -> List[Dict]:
+EMBEDDING_MODEL = "text-embedding-004"
+
+
+def embed_texts(texts: List[str]) -> np.ndarray:
+    """Embed texts as a float32 matrix, reusing vectors from the shared cache.
+
+    Only texts not already cached on this node are sent to the API.
     """
-    Takes a list of chunk dicts and adds a vector embedding to each.
+    keys = [hashlib.sha256(t.encode("utf-8")).hexdigest() for t in texts]
+    cached = cache.get_many(f"embedding:{EMBEDDING_MODEL}", set(keys))
+    missing = list(dict.fromkeys(k for k in keys if k not in cached))
+    if missing:
+        text_by_key = dict(zip(keys, texts))
+        model = TextEmbeddingModel.from_pretrained(EMBEDDING_MODEL)
+        # The API has a limit on the number of texts per call
+        batch_size = 200
+        for i in range(0, len(missing), batch_size):
+            batch = missing[i:i + batch_size]
+            embeddings = call("embeddings", model.get_embeddings, [text_by_key[k] for k in batch])
+            fresh = {k: np.asarray(e.values, dtype=np.float32) for k, e in zip(batch, embeddings)}
+            cache.set_many(f"embedding:{EMBEDDING_MODEL}", fresh)
+            cached.update(fresh)
+            #print(f"  -> Embedded batch {i // batch_size + 1} ({len(batch)} texts)")
+    return np.stack([cached[k] for k in keys]) if keys else np.empty((0, 0), dtype=np.float32)
+
+
+def embed_text_chunks(chunk_set: ChunkSet) -> ChunkSet:
+    """
+    Takes a ChunkSet and returns the embeddable subset with its vectors
+    filled in as one float32 matrix.
     """
     #print("Step 2: Starting the embedding process...")
     
     # Deduplicate and filter again defensively
     seen = set()
-    filtered_chunks: List[Dict] = []
-    for ch in chunks:
-        t = _normalize_ws(ch.get("text", ""))
+    keep: List[int] = []
+    for i in range(len(chunk_set)):
+        t = chunk_set.text_at(i)
         key = t.lower()
-        if not t or _is_low_value(t) or key in seen:
+        # Merged windows are already sized; only single paragraphs are filtered
+        if not t or (not chunk_set.is_window(i) and _is_low_value(t)) or key in seen:
             continue
         seen.add(key)
-        ch["text"] = t
-        filtered_chunks.append(ch)
+        keep.append(i)
 
-    if not filtered_chunks:
+    filtered = chunk_set.subset(keep)
+    if not keep:
         #print("-> No valid chunks to embed after filtering.")
-        return []
+        return filtered
 
-    model = TextEmbeddingModel.from_pretrained("text-embedding-004")
-    text_to_embed = [chunk['text'] for chunk in filtered_chunks]
-    
-    # The API has a limit on the number of texts per call
-    batch_size = 200
-    all_embeddings = []
-    
-    for i in range(0, len(text_to_embed), batch_size):
-        batch = text_to_embed[i:i + batch_size]
-        embeddings = model.get_embeddings(batch)
-        all_embeddings.extend(embeddings)
-        #print(f"  -> Embedded batch {i // batch_size + 1} ({len(batch)} texts)")
-
-    # Add the vector back to its corresponding chunk dict
-    for i, chunk in enumerate(filtered_chunks):
-        chunk['vector'] = all_embeddings[i].values
+    filtered.vectors = embed_texts([filtered.text_at(j) for j in range(len(filtered))])
     
-    #print(f"-> Successfully embedded all {len(filtered_chunks)} chunks (from {len(chunks)} input chunks).")
-    return filtered_chunks
+    #print(f"-> Successfully embedded all {len(filtered)} chunks (from {len(chunk_set)} input chunks).")
+    return filtered
 
 # --- Step 3: Storing & Indexing ---
-def store_vectors_in_vector_search(chunks_with_vectors: List[Dict]):
+def store_vectors_in_vector_search(chunks_with_vectors: ChunkSet):
     """
     Upserts the vectors into the specified Vertex AI Vector Search index.
     """
@@ -191,13 +431,13 @@ def store_vectors_in_vector_search(chunks_with_vectors: List[Dict]):
 
     # Prepare datapoints for upserting
     datapoints_to_upsert = []
-    for chunk in chunks_with_vectors:
+    for i, chunk_id in enumerate(chunks_with_vectors.ids):
         datapoint = {
-            "datapoint_id": chunk['id'],
-            "feature_vector": chunk['vector'],
+            "datapoint_id": chunk_id,
+            "feature_vector": chunks_with_vectors.vectors[i].tolist(),
             "restricts": [{
                 "namespace": "document_id",
-                "allow_list": [chunk['document_id']]
+                "allow_list": [chunks_with_vectors.document_id]
             }]
         }
         datapoints_to_upsert.append(datapoint)
@@ -207,27 +447,135 @@ def store_vectors_in_vector_search(chunks_with_vectors: List[Dict]):
     for i in range(0, len(datapoints_to_upsert), batch_size):
         batch = datapoints_to_upsert[i:i+batch_size]
         # Upsert into the index
-        index.upsert_datapoints(datapoints=batch)
+        call("vector_write", index.upsert_datapoints, datapoints=batch)
 
     #print(f"-> Successfully stored {len(datapoints_to_upsert)} vectors.")
 
+def remove_vectors_from_vector_search(datapoint_ids: List[str]):
+    """
+    Removes datapoints from the Vertex AI Vector Search index.
+    """
+    if not datapoint_ids:
+        return
+
+    aiplatform.init(project=PROJECT_ID, location=LOCATION)
+    index = aiplatform.MatchingEngineIndex(
+        index_name=VECTOR_SEARCH_INDEX_ID
+    )
+
+    batch_size = 100
+    for i in range(0, len(datapoint_ids), batch_size):
+        call("vector_write", index.remove_datapoints, datapoint_ids=datapoint_ids[i:i+batch_size])
+
+def read_vectors_from_vector_search(datapoint_ids: List[str]) -> Dict[str, List[float]]:
+    """
+    Reads stored feature vectors back from the deployed index.
+    """
+    if not datapoint_ids:
+        return {}
+
+    aiplatform.init(project=PROJECT_ID, location=LOCATION)
+    index_endpoint = aiplatform.MatchingEngineIndexEndpoint(
+        index_endpoint_name=VECTOR_SEARCH_ENDPOINT_ID
+    )
+
+    vectors = {}
+    batch_size = 100
+    for i in range(0, len(datapoint_ids), batch_size):
+        datapoints = call(
+            "vector_search", index_endpoint.read_index_datapoints,
+            deployed_index_id=DEPLOYED_INDEX_ID,
+            ids=datapoint_ids[i:i+batch_size],
+        )
+        for datapoint in datapoints:
+            vectors[datapoint.datapoint_id] = list(datapoint.feature_vector)
+    return vectors
+
+# --- Index manifest: which datapoints are live for a document ---
+def _manifest_path(document_id: str) -> str:
+    return f"index/{document_id}.json"
+
+def load_index_manifest(document_id: str) -> Optional[List[str]]:
+    """
+    Returns the datapoint ids indexed for the document on the last run,
+    or None if the document has never been indexed incrementally.
+    Any failure other than a missing manifest (timeouts, outages) is raised.
+    """
+    try:
+        response = call("storage", storage.download_sync, _manifest_path(document_id), native_timeout=timeout_kwarg)
+    except Exception as e:  # noqa: BLE001
+        if is_not_found(e):
+            return None
+        raise
+    return json.loads(response).get("datapoint_ids", [])
+
+def save_index_manifest(document_id: str, datapoint_ids: List[str]):
+    call(
+        "storage_write", storage.upload_sync, _manifest_path(document_id),
+        json.dumps({"document_id": document_id, "datapoint_ids": sorted(datapoint_ids)}).encode("utf-8"),
+        native_timeout=timeout_kwarg,
+    )
+
 
 def create_rag(file_path: str):
     """
     Orchestrates the entire RAG process for a given document file path.
+
+    Re-indexing is incremental per document: the manifest is keyed by the
+    upload's document id, so uploading a revised lease creates a new
+    document whose datapoints are all written again. Only the embedding
+    calls are shared across documents, through the node cache keyed by
+    text hash in `embed_texts`.
     """
     # --- Main execution block ---
     # --- This part is the ONE-TIME SETUP for a new document ---
     # 1. Chunking
     bucket_file_path = file_path.replace("https://jmyrzhpfzcaebymsmjcm.supabase.co/storage/v1/object/public/ocr_bucket/", "")
     document_id = bucket_file_path[5:-5:]
-    chunks = create_chunks_from_doc_ai_json(bucket_file_path, document_id)
+    doc_ai_json = load_doc_ai_json(bucket_file_path)
+    chunk_set = load_chunk_set(bucket_file_path, document_id, doc_ai_json)
 
-    # 2. Embedding
-    chunks_with_vectors = embed_text_chunks(chunks)
+    # Diff against the previously indexed set. Ids are content hashes, so an
+    # unchanged id means unchanged text and its vector can stay as it is.
+    previous_ids = load_index_manifest(document_id)
+    if previous_ids is None:
+        # Never indexed incrementally: clear position-based datapoints, if
+        # the document is old enough to have any
+        previous_ids = legacy_chunk_ids(doc_ai_json, document_id) if may_have_legacy_ids(bucket_file_path) else []
+    previous_ids = set(previous_ids)
+    current_ids = set(chunk_set.ids)
+    new_chunks = chunk_set.subset([i for i, chunk_id in enumerate(chunk_set.ids) if chunk_id not in previous_ids])
+    stale_ids = sorted(previous_ids - current_ids)
+
+    # 2. Embedding (new or changed text only)
+    chunks_with_vectors = embed_text_chunks(new_chunks)
     
     # 3. Storing
-    store_vectors_in_vector_search(chunks_with_vectors)
+    if chunks_with_vectors:
+        store_vectors_in_vector_search(chunks_with_vectors)
+    remove_vectors_from_vector_search(stale_ids)
+
+    indexed_ids = (previous_ids & current_ids) | set(chunks_with_vectors.ids)
+    if indexed_ids != previous_ids:
+        save_index_manifest(document_id, list(indexed_ids))
+
+    # 4. Keep a quantized copy resident for local retrieval, unless this
+    # worker already holds exactly these chunks in the configured mode
+    wanted = (VECTOR_QUANTIZATION, frozenset(indexed_ids))
+    if VECTOR_QUANTIZATION != "none" and indexed_ids and resident_state(document_id) != wanted:
+        try:
+            vectors = {chunk_id: chunks_with_vectors.vectors[i] for i, chunk_id in enumerate(chunks_with_vectors.ids)}
+            vectors.update(read_vectors_from_vector_search(sorted(indexed_ids - set(vectors))))
+            rows, seen = [], set()
+            for i, chunk_id in enumerate(chunk_set.ids):
+                if chunk_id in vectors and chunk_id not in seen:
+                    seen.add(chunk_id)
+                    rows.append(i)
+            resident = chunk_set.subset(rows)
+            resident.vectors = np.array([vectors[chunk_id] for chunk_id in resident.ids], dtype=np.float32)
+            make_resident(resident)
+        except Exception as e:  # noqa: BLE001
+            print(f"Could not keep {document_id} resident: {e}")
     
     #print("\n--- Document processing and indexing complete. The system is ready for questions. ---\n")
     
@@ -241,10 +589,10 @@ if __name__ == "__main__":
     bucket_file_path = LOCAL_JSON_FILE_PATH.replace("https://jmyrzhpfzcaebymsmjcm.supabase.co/storage/v1/object/public/ocr_bucket/", "")
     document_id = bucket_file_path[5:-5:]
     #print(f"Document ID: {document_id}")
-    chunks = create_chunks_from_doc_ai_json(bucket_file_path,document_id)
+    chunk_set = load_chunk_set(bucket_file_path, document_id)
     
     # 2. Embedding
-    chunks_with_vectors = embed_text_chunks(chunks)
+    chunks_with_vectors = embed_text_chunks(chunk_set)
     
     # # 3. Storing
     store_vectors_in_vector_search(chunks_with_vectors)
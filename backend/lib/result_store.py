@@ -0,0 +1,55 @@
+import hashlib
+import json
+from dotenv import load_dotenv
+from typing import Any, Dict, List, Optional
+
+from .storage import storage
+from .deadline import call, timeout_kwarg
+from .cache import cache
+
+load_dotenv()
+
+
+def content_hash(raw: bytes) -> str:
+    """SHA-256 of a downloaded OCR JSON; identifies the document version."""
+    return hashlib.sha256(raw).hexdigest()
+
+
+def _result_path(kind: str, document_id: str, doc_hash: str, prompt_version: str, model_name: str) -> str:
+    return f"analysis/{document_id}/{kind}-{model_name}-{prompt_version}-{doc_hash[:16]}.json"
+
+
+def load_result(kind: str, document_id: str, doc_hash: str, prompt_version: str, model_name: str) -> Optional[Dict[str, Any]]:
+    """Return a stored analysis result, or None on a miss.
+
+    Results are keyed by document id, content hash, prompt version and
+    model name, so changing any of them is a miss rather than a stale hit.
+    That also makes them safe to keep in the shared local cache.
+    """
+    path = _result_path(kind, document_id, doc_hash, prompt_version, model_name)
+    result = cache.get("result", path)
+    if result is not None:
+        return result
+    try:
+        response = call("storage", storage.download_sync, path, native_timeout=timeout_kwarg)
+    except Exception:
+        return None
+    result = json.loads(response)
+    cache.set("result", path, result)
+    return result
+
+
+def save_result(kind: str, document_id: str, doc_hash: str, prompt_version: str, model_name: str, result: Dict[str, Any]):
+    path = _result_path(kind, document_id, doc_hash, prompt_version, model_name)
+    call(
+        "storage_write", storage.upload_sync, path,
+        json.dumps(result).encode("utf-8"),
+        native_timeout=timeout_kwarg,
+    )
+    cache.set("result", path, result)
+
+
+def list_result_paths(document_id: str) -> List[str]:
+    """Paths of every stored result for a document (for deletion)."""
+    entries = call("storage", storage.list_sync, f"analysis/{document_id}", native_timeout=timeout_kwarg) or []
+    return [f"analysis/{document_id}/{entry['name']}" for entry in entries if entry.get("name")]
@@ -0,0 +1,209 @@
+import os
+import re
+from dotenv import load_dotenv
+from typing import Dict, List, Optional
+
+from google.cloud import aiplatform
+from google.cloud.aiplatform.matching_engine.matching_engine_index_endpoint import Namespace
+from .rag_builder import embed_texts, load_chunk_set, load_doc_ai_json, load_paragraph_set
+from .deadline import call
+
+load_dotenv()
+
+PROJECT_ID = os.getenv("PROJECT_ID")
+LOCATION = "us-central1"  # e.g., us-central1
+VECTOR_SEARCH_ENDPOINT_ID = os.getenv("VECTOR_SEARCH_ENDPOINT_ID")
+DEPLOYED_INDEX_ID = os.getenv("DEPLOYED_INDEX_ID")
+
+# How many clauses to keep per category and overall
+CANDIDATES_PER_CATEGORY = 3
+MAX_RISK_CANDIDATES = 15
+# Neighbors requested per category from the document's vectors
+NEIGHBORS_PER_CATEGORY = 10
+# Blend of keyword and embedding evidence, and the cut-off for a candidate
+KEYWORD_WEIGHT = 0.6
+EMBEDDING_WEIGHT = 0.4
+MIN_CANDIDATE_SCORE = 0.25
+
+# The seven categories the risk prompt describes. Each one has a short
+# prototype (embedded once per node) and keyword patterns.
+RISK_CATEGORIES: Dict[str, Dict] = {
+    "lock_in": {
+        "label": "Lock-in Period",
+        "prototype": "The tenant is bound by a mandatory lock-in period and must pay rent for the remaining duration if they vacate early.",
+        "patterns": [r"lock[\s-]?in", r"minimum (?:lease |rental )?(?:term|period)", r"remaining (?:duration|term|period)", r"vacate .{0,40}before"],
+    },
+    "notice_period": {
+        "label": "Notice Period",
+        "prototype": "The tenant must give a long written notice period before vacating or forfeit the security deposit.",
+        "patterns": [r"notice period", r"\d+\s*(?:days?|months?)['’]?\s*(?:written |prior )?notice", r"forfeit", r"security deposit"],
+    },
+    "force_majeure": {
+        "label": "Force Majeure",
+        "prototype": "Rent shall not be waived or reduced due to force majeure events such as natural disasters, epidemics or lockdowns.",
+        "patterns": [r"force majeure", r"act(?:s)? of god", r"natural (?:disaster|calamit)", r"epidemic|pandemic|lockdown", r"uninhabitable"],
+    },
+    "maintenance": {
+        "label": "Maintenance and Repair Charges",
+        "prototype": "The tenant shall be solely responsible for all maintenance and repairs, including major appliances and structural elements, at their own expense.",
+        "patterns": [r"maintenance", r"repairs?", r"wear and tear", r"at the tenant'?s? (?:own )?(?:cost|expense)", r"structural"],
+    },
+    "subletting": {
+        "label": "Subletting",
+        "prototype": "Subletting the property is strictly prohibited and any unauthorized subletting results in immediate termination and a penalty.",
+        "patterns": [r"sub[\s-]?let", r"sub[\s-]?lease", r"assign(?:ment)? .{0,30}(?:premises|agreement)", r"paying guest"],
+    },
+    "termination": {
+        "label": "Termination Clause (By Landlord)",
+        "prototype": "The landlord may terminate this agreement at any time for any reason or no reason by giving short written notice.",
+        "patterns": [r"terminat", r"for (?:any|no) reason", r"at (?:its|his|her|their) (?:sole )?discretion", r"evict"],
+    },
+    "indemnity": {
+        "label": "Indemnity Clause",
+        "prototype": "The tenant agrees to indemnify and hold harmless the landlord from all claims and damages, regardless of the landlord's negligence.",
+        "patterns": [r"indemnif", r"hold (?:the \w+ )?harmless", r"liabilit", r"negligence", r"claims?,? (?:and |or )?damages"],
+    },
+}
+
+_COMPILED_PATTERNS: Dict[str, List[re.Pattern]] = {
+    name: [re.compile(p, re.IGNORECASE) for p in spec["patterns"]]
+    for name, spec in RISK_CATEGORIES.items()
+}
+
+
+def _get_category_embeddings() -> Dict[str, List[float]]:
+    """Embeds the category prototypes (cached once per node)."""
+    names = list(RISK_CATEGORIES)
+    vectors = embed_texts([RISK_CATEGORIES[n]["prototype"] for n in names])
+    return {n: v.tolist() for n, v in zip(names, vectors)}
+
+
+def _keyword_scores(text: str) -> Dict[str, float]:
+    """Fraction of a category's patterns that match the text (0..1)."""
+    scores = {}
+    for name, patterns in _COMPILED_PATTERNS.items():
+        hits = sum(1 for p in patterns if p.search(text))
+        if hits:
+            scores[name] = min(hits, 3) / 3
+    return scores
+
+
+def _embedding_scores(document_id: str) -> Dict[str, Dict[str, float]]:
+    """Rank-based similarity of the document's indexed chunks to each category.
+
+    Runs a single batched `find_neighbors` call restricted to the document's
+    namespace, so the chunk vectors already in the index are reused.
+    Returns {category: {chunk_id: score}} with scores in 0..1.
+    """
+    aiplatform.init(project=PROJECT_ID, location=LOCATION)
+    category_embeddings = _get_category_embeddings()
+    names = list(category_embeddings)
+    index_endpoint = aiplatform.MatchingEngineIndexEndpoint(
+        index_endpoint_name=VECTOR_SEARCH_ENDPOINT_ID
+    )
+    search_results = call(
+        "vector_search", index_endpoint.find_neighbors,
+        deployed_index_id=DEPLOYED_INDEX_ID,
+        queries=[category_embeddings[n] for n in names],
+        num_neighbors=NEIGHBORS_PER_CATEGORY,
+        filter=[Namespace(name="document_id", allow_tokens=[document_id], deny_tokens=[])],
+    )
+
+    scores: Dict[str, Dict[str, float]] = {}
+    for name, matches in zip(names, search_results or []):
+        per_chunk = {}
+        for rank, match in enumerate(matches or []):
+            chunk_id = getattr(match, "datapoint_id", None) or getattr(match, "id", None)
+            if chunk_id:
+                per_chunk[chunk_id] = 1 - rank / NEIGHBORS_PER_CATEGORY
+        scores[name] = per_chunk
+    return scores
+
+
+def _paragraph_embedding_scores(paragraphs, indexed, embedding_scores: Dict[str, Dict[str, float]]) -> Dict[str, Dict[str, float]]:
+    """Carry each indexed chunk's scores over to the paragraphs inside it.
+
+    Indexed chunks are single paragraphs or structural windows; a paragraph
+    gets the best score of any indexed chunk that covers its start offset.
+    """
+    spans = [(indexed.starts[j], indexed.ends[j], chunk_id) for j, chunk_id in enumerate(indexed.ids)]
+    scores: Dict[str, Dict[str, float]] = {}
+    for name, per_chunk in embedding_scores.items():
+        if not per_chunk:
+            continue
+        per_paragraph = scores.setdefault(name, {})
+        for i, paragraph_id in enumerate(paragraphs.ids):
+            start = paragraphs.starts[i]
+            best = max((per_chunk.get(chunk_id, 0.0) for s, e, chunk_id in spans if s <= start < e), default=0.0)
+            if best:
+                per_paragraph[paragraph_id] = max(best, per_paragraph.get(paragraph_id, 0.0))
+    return scores
+
+
+def select_risk_candidates(file_path: str, document_id: str, doc_ai_json: Optional[dict] = None) -> List[Dict]:
+    """Pick the clauses most likely to match one of the risk categories.
+
+    Args:
+        file_path: Path of the OCR JSON inside the Supabase bucket.
+        document_id: Id used for the document's chunks and index namespace.
+        doc_ai_json: Already downloaded OCR JSON, if the caller has it.
+    Returns:
+        Candidate paragraphs ordered by page, each with `text`, `page_number`,
+        `categories` and `score`. Empty if nothing scored above the cut-off.
+    """
+    if doc_ai_json is None:
+        doc_ai_json = load_doc_ai_json(file_path)
+    # Every paragraph is a candidate, including the numbered clauses that
+    # indexing treats as headings; the index only adds embedding evidence
+    chunk_set = load_paragraph_set(file_path, document_id, doc_ai_json)
+    if not len(chunk_set):
+        return []
+
+    try:
+        embedding_scores = _paragraph_embedding_scores(
+            chunk_set, load_chunk_set(file_path, document_id, doc_ai_json), _embedding_scores(document_id)
+        )
+    except Exception:
+        # Document not indexed yet or Vector Search unavailable: keywords only
+        embedding_scores = {}
+    # A document that is not indexed yet returns empty neighbor lists; that
+    # is no embedding evidence either, so keywords carry the full weight
+    keyword_weight = KEYWORD_WEIGHT if any(embedding_scores.values()) else 1.0
+
+    # Score every chunk against every category
+    scored: Dict[str, Dict[str, float]] = {}
+    for i, chunk_id in enumerate(chunk_set.ids):
+        keyword_scores = _keyword_scores(chunk_set.text_at(i))
+        for name in RISK_CATEGORIES:
+            score = keyword_weight * keyword_scores.get(name, 0.0)
+            score += EMBEDDING_WEIGHT * embedding_scores.get(name, {}).get(chunk_id, 0.0)
+            if score >= MIN_CANDIDATE_SCORE:
+                scored.setdefault(name, {})[chunk_id] = score
+
+    # Keep the best few per category, then cap the overall set
+    best: Dict[str, Dict] = {}
+    for name, per_chunk in scored.items():
+        top = sorted(per_chunk.items(), key=lambda kv: kv[1], reverse=True)[:CANDIDATES_PER_CATEGORY]
+        for chunk_id, score in top:
+            i = chunk_set.index_of(chunk_id)
+            entry = best.setdefault(chunk_id, {
+                "id": chunk_id,
+                "text": chunk_set.text_at(i),
+                "page_number": chunk_set.pages[i],
+                "categories": [],
+                "score": 0.0,
+            })
+            entry["categories"].append(RISK_CATEGORIES[name]["label"])
+            entry["score"] = max(entry["score"], score)
+
+    candidates = sorted(best.values(), key=lambda c: c["score"], reverse=True)[:MAX_RISK_CANDIDATES]
+    candidates.sort(key=lambda c: chunk_set.index_of(c["id"]))
+    return candidates
+
+
+def format_risk_candidates(candidates: List[Dict]) -> str:
+    """Renders candidates as page-tagged clauses for the risk prompt."""
+    return "\n\n".join(
+        f"[Page {c['page_number']}] ({', '.join(c['categories'])}) {c['text']}"
+        for c in candidates
+    )
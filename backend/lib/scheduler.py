@@ -0,0 +1,314 @@
+import contextvars
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from dotenv import load_dotenv
+from typing import Any, Deque, Dict, List, Optional
+
+load_dotenv()
+
+# Priority classes, most urgent first
+INTERACTIVE, ANALYSIS, INGESTION = 0, 1, 2
+PRIORITY_NAMES = ("interactive", "analysis", "ingestion")
+
+
+@dataclass(frozen=True)
+class Quota:
+    max_concurrent: int
+    # Calls started per second across the worker (0 = unlimited)
+    rate_per_second: float = 0.0
+    # Slots only interactive work may take, so bulk work never fills the upstream
+    reserved_interactive: int = 1
+
+
+QUOTAS: Dict[str, Quota] = {
+    "document_ai": Quota(max_concurrent=4, reserved_interactive=1),
+    "embeddings": Quota(max_concurrent=8, reserved_interactive=2),
+    "vector_search": Quota(max_concurrent=8, reserved_interactive=2),
+    "gemini": Quota(max_concurrent=8, reserved_interactive=2),
+    "storage": Quota(max_concurrent=16, reserved_interactive=4),
+}
+
+# deadline.call stages -> the upstream whose quota they draw from
+STAGE_UPSTREAMS: Dict[str, str] = {
+    "document_ai": "document_ai",
+    "embeddings": "embeddings",
+    "vector_search": "vector_search",
+    "vector_write": "vector_search",
+    "generate": "gemini",
+    "storage": "storage",
+    "storage_write": "storage",
+}
+
+
+# Quotas are enforced per process; the node-wide budget is split evenly
+# across the server's worker processes (WEB_CONCURRENCY, as set for
+# uvicorn --workers / gunicorn)
+WORKER_PROCESSES = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+
+
+def _per_worker(name: str, quota: Quota, workers: int) -> Quota:
+    """One worker's share of a node-wide quota.
+
+    The shares never add up to more than the node budget, and each keeps
+    at least one interactive-only slot whenever it has two or more.
+
+    Raises:
+        ValueError: the upstream has fewer slots than there are workers.
+    """
+    max_concurrent = quota.max_concurrent // workers
+    if max_concurrent < 1:
+        raise ValueError(
+            f"{name}: {quota.max_concurrent} concurrent calls cannot be split across {workers} workers; "
+            "raise its UPSTREAM_QUOTAS entry or lower WEB_CONCURRENCY"
+        )
+    if max_concurrent < 2:
+        print(
+            f"Warning: {name} has one slot per worker, so none is reserved for interactive requests; "
+            f"set its UPSTREAM_QUOTAS entry to at least {2 * workers} to reserve one"
+        )
+    return Quota(
+        max_concurrent=max_concurrent,
+        rate_per_second=quota.rate_per_second / workers,
+        reserved_interactive=min(max(1, quota.reserved_interactive // workers), max_concurrent - 1),
+    )
+
+
+def _parse_quota_overrides(spec: str) -> Dict[str, Quota]:
+    """Parse UPSTREAM_QUOTAS, e.g. "gemini=4:2,embeddings=8" (concurrency[:rate])."""
+    quotas = dict(QUOTAS)
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, value = item.partition("=")
+        concurrency, _, rate = value.partition(":")
+        base = quotas.get(name.strip(), Quota(max_concurrent=1))
+        quotas[name.strip()] = Quota(
+            max_concurrent=int(concurrency),
+            rate_per_second=float(rate) if rate else base.rate_per_second,
+            reserved_interactive=base.reserved_interactive,
+        )
+    return quotas
+
+
+QUOTAS = {
+    name: _per_worker(name, quota, WORKER_PROCESSES)
+    for name, quota in _parse_quota_overrides(os.getenv("UPSTREAM_QUOTAS", "")).items()
+}
+
+_priority: contextvars.ContextVar[int] = contextvars.ContextVar("priority", default=INGESTION)
+_user: contextvars.ContextVar[str] = contextvars.ContextVar("user", default="system")
+
+
+@contextmanager
+def priority_scope(priority: Optional[int] = None, user: Optional[str] = None):
+    """Run the enclosed work (and threads started from it) as `priority` on behalf of `user`.
+
+    Unset arguments keep the enclosing values; work outside any scope runs
+    as ingestion for the "system" user.
+    """
+    tokens = []
+    if priority is not None:
+        tokens.append((_priority, _priority.set(priority)))
+    if user is not None:
+        tokens.append((_user, _user.set(user)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+class _Waiter:
+    __slots__ = ("event", "priority", "user", "enqueued", "granted")
+
+    def __init__(self, priority: int, user: str):
+        self.event = threading.Event()
+        self.priority = priority
+        self.user = user
+        self.enqueued = time.monotonic()
+        self.granted = False
+
+
+class _ClassStats:
+    __slots__ = ("granted", "timed_out", "wait_total", "wait_max", "recent")
+
+    def __init__(self):
+        self.granted = 0
+        self.timed_out = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.recent: Deque[float] = deque(maxlen=512)
+
+    def as_dict(self) -> Dict[str, Any]:
+        recent = sorted(self.recent)
+        return {
+            "granted": self.granted,
+            "timed_out": self.timed_out,
+            "wait_avg_ms": 1000 * self.wait_total / self.granted if self.granted else 0.0,
+            "wait_p95_ms": 1000 * recent[int(0.95 * (len(recent) - 1))] if recent else 0.0,
+            "wait_max_ms": 1000 * self.wait_max,
+        }
+
+
+class _Upstream:
+    """Slots and call rate for one upstream API, granted by priority then round-robin per user."""
+
+    def __init__(self, name: str, quota: Quota):
+        self.name = name
+        self.quota = quota
+        self.in_use = 0
+        self.tokens = max(1.0, quota.rate_per_second)
+        self.refilled = time.monotonic()
+        self.lock = threading.Lock()
+        # Per class: user -> that user's waiters; dict order is the round-robin order
+        self.queues: List["OrderedDict[str, Deque[_Waiter]]"] = [OrderedDict() for _ in PRIORITY_NAMES]
+        self.stats = [_ClassStats() for _ in PRIORITY_NAMES]
+
+    def _limit(self, priority: int) -> int:
+        if priority == INTERACTIVE:
+            return self.quota.max_concurrent
+        return max(1, self.quota.max_concurrent - self.quota.reserved_interactive)
+
+    def _take_token(self) -> bool:
+        rate = self.quota.rate_per_second
+        if rate <= 0:
+            return True
+        now = time.monotonic()
+        self.tokens = min(max(1.0, rate), self.tokens + (now - self.refilled) * rate)
+        self.refilled = now
+        if self.tokens < 1.0:
+            return False
+        self.tokens -= 1.0
+        return True
+
+    def _grant(self, waiter: _Waiter):
+        waited = time.monotonic() - waiter.enqueued
+        stats = self.stats[waiter.priority]
+        stats.granted += 1
+        stats.wait_total += waited
+        stats.wait_max = max(stats.wait_max, waited)
+        stats.recent.append(waited)
+        waiter.granted = True
+        self.in_use += 1
+        waiter.event.set()
+
+    def _dispatch(self):
+        # Caller holds self.lock. Strict priority between classes: a lower
+        # class never overtakes a higher one that is still waiting.
+        for priority, queue in enumerate(self.queues):
+            while queue:
+                if self.in_use >= self._limit(priority) or not self._take_token():
+                    return
+                user, waiters = next(iter(queue.items()))
+                waiter = waiters.popleft()
+                # Move the user to the back so every user gets a turn
+                del queue[user]
+                if waiters:
+                    queue[user] = waiters
+                self._grant(waiter)
+
+    def _remove(self, waiter: _Waiter):
+        queue = self.queues[waiter.priority]
+        waiters = queue.get(waiter.user)
+        if waiters is not None:
+            waiters.remove(waiter)
+            if not waiters:
+                del queue[waiter.user]
+
+    def acquire(self, priority: int, user: str, timeout: Optional[float]) -> bool:
+        waiter = _Waiter(priority, user)
+        with self.lock:
+            self.queues[priority].setdefault(user, deque()).append(waiter)
+            self._dispatch()
+        give_up = None if timeout is None else time.monotonic() + timeout
+        # With a rate limit nobody releases a slot when a token refills, so poll
+        poll = 0.05 if self.quota.rate_per_second > 0 else None
+        while True:
+            left = None if give_up is None else give_up - time.monotonic()
+            wait_for = poll if left is None else (left if poll is None else min(poll, left))
+            if waiter.event.wait(max(0.0, wait_for) if wait_for is not None else None):
+                return True
+            with self.lock:
+                if waiter.granted:
+                    return True
+                if give_up is not None and time.monotonic() >= give_up:
+                    self._remove(waiter)
+                    self.stats[priority].timed_out += 1
+                    return False
+                self._dispatch()
+
+    def try_acquire(self, priority: int) -> bool:
+        with self.lock:
+            if any(self.queues[p] for p in range(priority + 1)):
+                return False
+            if self.in_use >= self._limit(priority) or not self._take_token():
+                return False
+            self.in_use += 1
+            return True
+
+    def release(self):
+        with self.lock:
+            self.in_use -= 1
+            self._dispatch()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "in_use": self.in_use,
+                "max_concurrent": self.quota.max_concurrent,
+                "rate_per_second": self.quota.rate_per_second,
+                "queued": {
+                    PRIORITY_NAMES[p]: sum(len(w) for w in queue.values())
+                    for p, queue in enumerate(self.queues)
+                },
+                "classes": {PRIORITY_NAMES[p]: s.as_dict() for p, s in enumerate(self.stats)},
+            }
+
+
+class Scheduler:
+    """Admission control for outbound model and API calls in this worker.
+
+    Quotas are per process: each worker gets 1/WEB_CONCURRENCY of the
+    configured node-wide budget.
+
+    Every `deadline.call` attempt takes a slot from its upstream's quota
+    before it starts and gives it back when it finishes. When the upstream
+    is saturated, queued calls are admitted by priority class (interactive
+    Q&A, then summary/risk, then ingestion) and round-robin between users
+    within a class, so one large ingest cannot crowd out other users'
+    questions. Part of each upstream's slots is kept for interactive work.
+    """
+
+    def __init__(self, quotas: Dict[str, Quota] = QUOTAS, stage_upstreams: Dict[str, str] = STAGE_UPSTREAMS):
+        self._upstreams = {name: _Upstream(name, quota) for name, quota in quotas.items()}
+        self._stage_upstreams = stage_upstreams
+
+    def _upstream(self, stage: str) -> Optional[_Upstream]:
+        return self._upstreams.get(self._stage_upstreams.get(stage, stage))
+
+    def acquire(self, stage: str, timeout: Optional[float] = None) -> bool:
+        """Wait for a slot for `stage` as the current priority and user; False on timeout."""
+        upstream = self._upstream(stage)
+        if upstream is None:
+            return True
+        return upstream.acquire(_priority.get(), _user.get(), timeout)
+
+    def try_acquire(self, stage: str) -> bool:
+        """Take a slot only if one is free and nobody of equal or higher priority is waiting."""
+        upstream = self._upstream(stage)
+        return upstream is None or upstream.try_acquire(_priority.get())
+
+    def release(self, stage: str):
+        upstream = self._upstream(stage)
+        if upstream is not None:
+            upstream.release()
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, slots in use and wait times per upstream and priority class."""
+        return {name: upstream.snapshot() for name, upstream in self._upstreams.items()}
+
+
+# Shared by every lib module in this worker
+scheduler = Scheduler()
@@ -0,0 +1,72 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+PUBLIC_URL_PREFIX = "https://jmyrzhpfzcaebymsmjcm.supabase.co/storage/v1/object/public/ocr_bucket/"
+
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: "asyncio.Task[Any]"):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesces concurrent identical async calls into one computation.
+
+    The first caller for a key starts the work; callers arriving while it is
+    in flight await the same task and get the same result or exception. The
+    key is forgotten as soon as the task finishes, so errors are not cached
+    and the next call retries. A cancelled caller only stops waiting; the
+    shared task is cancelled once no callers are left (work already running
+    in a thread keeps running until it returns).
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _, key=key, call=call: self._forget(key, call))
+
+        call.waiters += 1
+        try:
+            # shield: cancelling one waiter must not cancel the shared task
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # new callers must start fresh rather than join a cancelled task
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+                call.task.cancel()
+
+    def _forget(self, key: Hashable, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        if not call.task.cancelled():
+            call.task.exception()  # mark retrieved so it is not logged as unhandled
+
+
+def document_key(file_path: str) -> str:
+    """Coalescing key for a document version.
+
+    OCR artifacts are written once under a fresh `ocr/<uuid>.json` path, so
+    the bucket path identifies the document version.
+    """
+    if file_path.startswith(PUBLIC_URL_PREFIX):
+        file_path = file_path.replace(PUBLIC_URL_PREFIX, "", 1)
+    return file_path
+
+
+# Shared by the API routes and lib modules of this worker
+coalescer = SingleFlight()
@@ -0,0 +1,308 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+import threading
+from dotenv import load_dotenv
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+import httpx
+
+from .cache import private_dir
+
+load_dotenv()
+
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+BUCKET = os.getenv("SUPABASE_BUCKET")
+
+# Local copies of downloaded objects, revalidated with If-None-Match. Like
+# the node cache, the directory must be private or the blob cache is disabled.
+BLOB_CACHE_DIR = os.getenv("BLOB_CACHE_DIR", os.path.join(tempfile.gettempdir(), f"demystdocs_blobs-{os.getuid()}"))
+BLOB_CACHE_MAX_BYTES = int(os.getenv("BLOB_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+# Check the blob cache's size after this many bytes were written
+_EVICT_CHECK_BYTES = 16 * 1024 * 1024
+MAX_CONNECTIONS = 20
+
+try:
+    import h2  # noqa: F401  # HTTP/2 support for httpx
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+def is_not_found(exc: BaseException) -> bool:
+    """True when a storage read failed because the object does not exist.
+
+    Supabase Storage answers a missing object with 404, or with 400 and a
+    "not_found" error body on older deployments.
+    """
+    if not isinstance(exc, httpx.HTTPStatusError):
+        return False
+    status = exc.response.status_code
+    return status == 404 or (status == 400 and "not_found" in exc.response.text.lower().replace(" ", "_"))
+
+
+class AsyncStorage:
+    """Supabase Storage over one pooled (HTTP/2 when available) client.
+
+    The client lives on a private event loop thread, so both async callers
+    (`await storage.download(...)`) and the synchronous lib code running in
+    worker threads (`storage.download_sync(...)`, `upload_sync`, `list_sync`,
+    `remove_sync`) share the same connection pool. Full downloads are cached
+    on disk with their ETag and revalidated with If-None-Match, so unchanged
+    objects are not transferred again.
+
+    `base_url` and `transport` can point the client at a local HTTP
+    stand-in, e.g. `AsyncStorage("http://127.0.0.1:9000", "key", "bucket")`.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        api_key: str,
+        bucket: str,
+        cache_dir: Optional[str] = BLOB_CACHE_DIR,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        http2: bool = HTTP2_AVAILABLE,
+    ):
+        self.base_url = (base_url or "").rstrip("/")
+        self.api_key = api_key
+        self.bucket = bucket
+        self.cache_dir = cache_dir
+        self._transport = transport
+        self._http2 = http2
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        self._written_since_check = 0
+        self._cache_checked = False
+
+    # --- event loop and client ---
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="storage-io", daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # Only called on the storage loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=f"{self.base_url}/storage/v1",
+                headers={"apikey": self.api_key or "", "Authorization": f"Bearer {self.api_key or ''}"},
+                http2=self._http2,
+                limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS),
+                timeout=httpx.Timeout(30.0, connect=5.0),
+                transport=self._transport,
+            )
+        return self._client
+
+    def _submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+    def _wait(self, coro, timeout: Optional[float]):
+        # On timeout the request is cancelled on the storage loop as well
+        future = self._submit(coro)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    def _object_url(self, path: str) -> str:
+        return f"/object/{self.bucket}/{quote(path)}"
+
+    def public_url(self, path: str) -> str:
+        """Public URL of an object (the bucket must allow public reads)."""
+        return f"{self.base_url}/storage/v1/object/public/{self.bucket}/{quote(path)}"
+
+    # --- on-disk blob cache ---
+    def _cache_path(self, path: str) -> str:
+        digest = hashlib.sha256(f"{self.bucket}/{path}".encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, digest + ".blob")
+
+    def _cache_usable(self) -> bool:
+        # Checked once: a directory another user created (or can write to)
+        # could hold planted blobs that would be served on a 304
+        with self._lock:
+            if self.cache_dir and not self._cache_checked:
+                try:
+                    private = private_dir(self.cache_dir)
+                except OSError:
+                    private = False
+                if not private:
+                    print(f"Blob cache directory {self.cache_dir} is not private to this user; blob cache disabled")
+                    self.cache_dir = None
+                self._cache_checked = True
+            return bool(self.cache_dir)
+
+    def _read_cache(self, path: str) -> Optional[Tuple[str, bytes]]:
+        if not self._cache_usable():
+            return None
+        try:
+            with open(self._cache_path(path), "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        # One file per object: the ETag line, then the body it belongs to
+        etag, newline, body = data.partition(b"\n")
+        if not newline:
+            return None
+        return etag.decode("utf-8", "replace"), body
+
+    def _write_cache(self, path: str, etag: str, body: bytes):
+        # Runs in a worker thread, off the storage loop
+        if not self._cache_usable() or "\n" in etag:
+            return
+        # ETag and body go into one file, replaced in a single rename, so a
+        # reader never sees a partial body or a body with another's ETag
+        try:
+            fd, tmp = tempfile.mkstemp(dir=self.cache_dir)
+            with os.fdopen(fd, "wb") as f:
+                f.write(etag.encode("utf-8") + b"\n")
+                f.write(body)
+            os.replace(tmp, self._cache_path(path))
+        except OSError as e:
+            # A failed cache write never fails the download
+            print(f"Could not cache {path}: {e}")
+            return
+        with self._lock:
+            self._written_since_check += len(body)
+            check = self._written_since_check >= _EVICT_CHECK_BYTES
+            if check:
+                self._written_since_check = 0
+        if check:
+            self._evict_cache()
+
+    def _evict_cache(self):
+        blobs = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".etag"):
+                # Left over from the two-file layout
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
+            elif name.endswith(".blob"):
+                full = os.path.join(self.cache_dir, name)
+                try:
+                    st = os.stat(full)
+                except OSError:
+                    continue
+                blobs.append((st.st_mtime, st.st_size, full))
+        total = sum(size for _, size, _ in blobs)
+        for _, size, full in sorted(blobs):
+            if total <= BLOB_CACHE_MAX_BYTES:
+                break
+            try:
+                os.remove(full)
+            except OSError:
+                pass
+            total -= size
+
+    # --- requests (run on the storage loop) ---
+    async def _download(self, path: str) -> bytes:
+        cached = self._read_cache(path)
+        headers = {"If-None-Match": cached[0]} if cached else {}
+        resp = await self._get_client().get(self._object_url(path), headers=headers)
+        if resp.status_code == 304 and cached:
+            try:
+                os.utime(self._cache_path(path))  # keep recently used blobs
+            except OSError:
+                pass
+            return cached[1]
+        resp.raise_for_status()
+        etag = resp.headers.get("etag")
+        if etag:
+            # File writes and the occasional eviction scan stay off the loop
+            await asyncio.to_thread(self._write_cache, path, etag, resp.content)
+        return resp.content
+
+    async def _download_range(self, path: str, start: int, end: Optional[int]) -> bytes:
+        byte_range = f"bytes={start}-{'' if end is None else end}"
+        resp = await self._get_client().get(self._object_url(path), headers={"Range": byte_range})
+        resp.raise_for_status()
+        if resp.status_code == 206:
+            return resp.content
+        # Server ignored the Range header and sent the whole object
+        return resp.content[start:None if end is None else end + 1]
+
+    async def _upload(self, path: str, data: bytes, content_type: str, upsert: bool) -> Dict[str, Any]:
+        resp = await self._get_client().post(
+            self._object_url(path),
+            content=data,
+            headers={"Content-Type": content_type, "x-upsert": "true" if upsert else "false"},
+        )
+        resp.raise_for_status()
+        return resp.json()
+
+    async def _list(self, prefix: str, limit: int, offset: int, search: Optional[str]) -> List[Dict[str, Any]]:
+        body: Dict[str, Any] = {
+            "prefix": prefix,
+            "limit": limit,
+            "offset": offset,
+            "sortBy": {"column": "name", "order": "asc"},
+        }
+        if search:
+            body["search"] = search
+        resp = await self._get_client().post(f"/object/list/{self.bucket}", json=body)
+        resp.raise_for_status()
+        return resp.json()
+
+    async def _remove(self, paths: List[str]) -> List[Dict[str, Any]]:
+        resp = await self._get_client().request("DELETE", f"/object/{self.bucket}", json={"prefixes": paths})
+        resp.raise_for_status()
+        return resp.json()
+
+    # --- public API ---
+    async def download(self, path: str) -> bytes:
+        """Download an object, served from the blob cache when unchanged."""
+        return await asyncio.wrap_future(self._submit(self._download(path)))
+
+    async def download_range(self, path: str, start: int, end: Optional[int] = None) -> bytes:
+        """Download bytes `start..end` (inclusive) of an object."""
+        return await asyncio.wrap_future(self._submit(self._download_range(path, start, end)))
+
+    def download_sync(self, path: str, timeout: Optional[float] = None) -> bytes:
+        """Blocking `download` for synchronous callers (not on the event loop).
+
+        On timeout the request is cancelled on the storage loop as well.
+        """
+        return self._wait(self._download(path), timeout)
+
+    def upload_sync(
+        self, path: str, data: bytes, content_type: str = "application/json",
+        upsert: bool = True, timeout: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """Write an object. With `upsert=False` an existing object is a 400/409 error."""
+        return self._wait(self._upload(path, data, content_type, upsert), timeout)
+
+    def list_sync(
+        self, prefix: str, limit: int = 100, offset: int = 0,
+        search: Optional[str] = None, timeout: Optional[float] = None,
+    ) -> List[Dict[str, Any]]:
+        """Objects directly under `prefix`, with `name`, `created_at` and `updated_at`."""
+        return self._wait(self._list(prefix, limit, offset, search), timeout)
+
+    def remove_sync(self, paths: List[str], timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Delete objects; returns the ones that existed."""
+        if not paths:
+            return []
+        return self._wait(self._remove(paths), timeout)
+
+    def close(self):
+        if self._loop is None:
+            return
+        if self._client is not None:
+            self._submit(self._client.aclose()).result()
+            self._client = None
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loop = None
+
+
+# Shared by every lib module in this worker
+storage = AsyncStorage(SUPABASE_URL, SUPABASE_KEY, BUCKET)
@@ -1,19 +1,46 @@
 """FastAPI wrapper exposing Document AI OCR functionality."""
-from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Query
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Query, BackgroundTasks
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
+import asyncio
+import hashlib
+import hmac
 import os
 import tempfile
 import pathlib
 from dotenv import load_dotenv
+from typing import Optional
 
 from lib import ocr
 from lib.get_summary import get_summary as generate_summary
 from lib.get_answer import answer_user_question
 from lib.get_risk import get_risk_statments 
+from lib.index_lifecycle import DOCUMENT_TTL_HOURS, delete_document, document_path, run_ttl_sweeper, touch_document
+from lib.single_flight import coalescer, document_key
+from lib.precompute import PRECOMPUTE_ON_UPLOAD, precompute_analysis
+from lib.deadline import REQUEST_DEADLINE_SECONDS, UPLOAD_DEADLINE_SECONDS, DeadlineExceeded, abandoned_attempts, deadline_scope
+from lib.cache import cache
+from lib.scheduler import ANALYSIS, INGESTION, INTERACTIVE, priority_scope, scheduler
+from lib.profiler import PROFILE_SLOW_MS, folded, is_admin, profiler
 
 load_dotenv()
-app = FastAPI(title="Document AI OCR API", version="0.1.0")
+
+# Shared with the authenticating proxy in front of the API, which sends
+# X-User-Id with X-User-Signature = hex HMAC-SHA256(USER_ID_SECRET, user id)
+USER_ID_SECRET = os.getenv("USER_ID_SECRET", "")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Expire unused documents in the background when a TTL is configured
+    sweeper = asyncio.create_task(run_ttl_sweeper()) if DOCUMENT_TTL_HOURS > 0 else None
+    yield
+    if sweeper:
+        sweeper.cancel()
+
+
+app = FastAPI(title="Document AI OCR API", version="0.1.0", lifespan=lifespan)
 
 # CORS configuration
 app.add_middleware(
@@ -26,6 +53,65 @@ app.add_middleware(
 )
 
 
+# Scheduler class for the outbound calls each endpoint makes
+ENDPOINT_PRIORITIES = {
+    "/ask": INTERACTIVE,
+    "/get_summary": ANALYSIS,
+    "/get_risk": ANALYSIS,
+    "/document": ANALYSIS,
+    "/get_ocr": INGESTION,
+}
+
+# Endpoints whose budget differs from REQUEST_DEADLINE_SECONDS
+ENDPOINT_DEADLINES = {
+    "/get_ocr": UPLOAD_DEADLINE_SECONDS,
+}
+
+
+def _authenticated_user(request: Request) -> Optional[str]:
+    """The verified X-User-Id, or None when the request carries no valid signature."""
+    user = request.headers.get("x-user-id")
+    if not USER_ID_SECRET or not user:
+        return None
+    expected = hmac.new(USER_ID_SECRET.encode("utf-8"), user.encode("utf-8"), hashlib.sha256).hexdigest()
+    return user if hmac.compare_digest(request.headers.get("x-user-signature", ""), expected) else None
+
+
+@app.middleware("http")
+async def request_deadline(request: Request, call_next):
+    # Every external call made while serving the request draws from this
+    # budget and is queued by endpoint priority, fairly between users
+    user = _authenticated_user(request) or (request.client.host if request.client else "anonymous")
+    priority = ENDPOINT_PRIORITIES.get(request.url.path, ANALYSIS)
+    seconds = ENDPOINT_DEADLINES.get(request.url.path, REQUEST_DEADLINE_SECONDS)
+    with deadline_scope(seconds), priority_scope(priority, user):
+        return await call_next(request)
+
+
+@app.middleware("http")
+async def profile_requests(request: Request, call_next):
+    # Admins can profile one request with X-Profile: 1 or ?profile=1; with
+    # PROFILE_SLOW_MS set, every request is sampled and slow ones are kept
+    requested = request.headers.get("x-profile") == "1" or request.query_params.get("profile") in ("1", "true")
+    if requested and not is_admin(request.headers.get("x-admin-token")):
+        return JSONResponse({"detail": "profiling requires a valid X-Admin-Token"}, status_code=403)
+    if request.url.path.startswith("/debug") or not (requested or PROFILE_SLOW_MS > 0):
+        return await call_next(request)
+
+    with profiler.profile(f"{request.method} {request.url.path}") as prof:
+        response = await call_next(request)
+    if requested or 1000 * prof.duration >= PROFILE_SLOW_MS:
+        reason = "requested" if requested else "slow"
+        await asyncio.to_thread(profiler.save, prof, reason, response.status_code)
+        response.headers["X-Profile-Id"] = prof.id
+    return response
+
+
+def _require_admin(request: Request):
+    if not is_admin(request.headers.get("x-admin-token")):
+        raise HTTPException(status_code=403, detail="a valid X-Admin-Token is required")
+
+
 @app.get("/")
 async def root():
     return {
@@ -40,8 +126,17 @@ async def health():
     return {"status": "ok"}
 
 
+@app.get("/metrics", summary="Cache hit rates and upstream queues for this worker")
+async def metrics():
+    return {
+        "cache": await asyncio.to_thread(cache.stats),
+        "scheduler": scheduler.stats(),
+        "abandoned_attempts": abandoned_attempts(),
+    }
+
+
 @app.post("/get_ocr", summary="Extract plain text from uploaded file")
-async def ocr_text(file: UploadFile = File(...)):
+async def ocr_text(request: Request, background_tasks: BackgroundTasks, file: UploadFile = File(...)):
     """Accept a file upload, persist temporarily, run Document AI OCR, return plain text."""
     # Derive a safe suffix from original filename (helps Document AI infer type via mime argument we already set internally)
     original_name = pathlib.Path(file.filename or "upload.bin")
@@ -57,9 +152,18 @@ async def ocr_text(file: UploadFile = File(...)):
             tmp.write(content)
             tmp_path = tmp.name
 
-        # Call OCR with the filesystem path
-        text = ocr.process_document_sample(file_path=tmp_path)
+        # Call OCR with the filesystem path, off the event loop: it can wait
+        # for a Document AI slot behind interactive work. Repeat uploads are
+        # only deduplicated for an authenticated user, never by client address.
+        text = await asyncio.to_thread(
+            profiler.tracked(ocr.process_document_sample), file_path=tmp_path, owner=_authenticated_user(request)
+        )
+        # Index and store summary/risk results after the response is sent
+        if PRECOMPUTE_ON_UPLOAD:
+            background_tasks.add_task(precompute_analysis, text["url"])
         return JSONResponse(text)
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:  # noqa: BLE001
         raise HTTPException(status_code=400, detail=str(e))
     finally:
@@ -70,7 +174,7 @@ async def ocr_text(file: UploadFile = File(...)):
                 pass
 
 @app.post("/get_summary", summary="Get summary of uploaded file")
-async def get_summary_endpoint(request: Request, file_path: str = Query(default=None)):
+async def get_summary_endpoint(request: Request, background_tasks: BackgroundTasks, file_path: str = Query(default=None)):
     """Accept a Supabase file path (via query param ?file_path=... or JSON body {"file_path": "..."}) and return a summary."""
     try:
         # Allow both query param and JSON body
@@ -91,16 +195,24 @@ async def get_summary_endpoint(request: Request, file_path: str = Query(default=
         if file_path.startswith(prefix):
             file_path = file_path.replace(prefix, "", 1)
 
-        summary = await generate_summary(file_path=file_path)
+        # Registry bookkeeping runs after the response and never fails it
+        background_tasks.add_task(touch_document, file_path)
+        # Identical in-flight requests share one computation
+        summary = await coalescer.do(
+            ("get_summary", document_key(file_path)),
+            lambda: generate_summary(file_path=file_path),
+        )
         return JSONResponse(summary)
     except HTTPException:
         # Re-raise HTTP exceptions untouched
         raise
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:  # noqa: BLE001
         raise HTTPException(status_code=400, detail=str(e))
     
 @app.post("/ask", summary="Ask a question about the uploaded file")
-async def ask_question_endpoint(request: Request, question: str = Query(default=None), file_path: str = Query(default=None)):
+async def ask_question_endpoint(request: Request, background_tasks: BackgroundTasks, question: str = Query(default=None), file_path: str = Query(default=None)):
     """Accept a question and a Supabase file path (via query params ?question=...&file_path=... or JSON body {"question": "...", "file_path": "..."}) and return an answer."""
     try:
         # Allow both query params and JSON body
@@ -121,17 +233,24 @@ async def ask_question_endpoint(request: Request, question: str = Query(default=
         if not file_path or not isinstance(file_path, str):
             raise HTTPException(status_code=422, detail="file_path is required")
 
-        response = answer_user_question(question=question, file_url=file_path)
+        # Registry bookkeeping runs after the response and never fails it
+        background_tasks.add_task(touch_document, file_path)
+        response = await coalescer.do(
+            ("ask", document_key(file_path), question),
+            lambda: asyncio.to_thread(profiler.tracked(answer_user_question), question=question, file_url=file_path),
+        )
         return JSONResponse({"response": response})
     except HTTPException:
         # Re-raise HTTP exceptions untouched
         raise
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:  # noqa: BLE001
         raise HTTPException(status_code=400, detail=str(e))
 
 
 @app.post("/get_risk", summary="Get risk statements from uploaded file")
-async def get_risk_endpoint(request: Request, file_path: str = Query(default=None)):
+async def get_risk_endpoint(request: Request, background_tasks: BackgroundTasks, file_path: str = Query(default=None)):
     """Accept a Supabase file path (via query param ?file_path=... or JSON body {"file_path": "..."}) and return risk statements."""
     try:
         # Allow both query param and JSON body
@@ -147,10 +266,67 @@ async def get_risk_endpoint(request: Request, file_path: str = Query(default=Non
         if not file_path or not isinstance(file_path, str):
             raise HTTPException(status_code=422, detail="file_path is required")
 
-        risk_statements = get_risk_statments(file_url=file_path)
+        # Registry bookkeeping runs after the response and never fails it
+        background_tasks.add_task(touch_document, file_path)
+        risk_statements = await coalescer.do(
+            ("get_risk", document_key(file_path)),
+            lambda: asyncio.to_thread(profiler.tracked(get_risk_statments), file_url=file_path),
+        )
         return JSONResponse(risk_statements)
     except HTTPException:
         # Re-raise HTTP exceptions untouched
         raise
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:  # noqa: BLE001
-        raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.delete("/document", summary="Delete an uploaded file and its index entries")
+async def delete_document_endpoint(request: Request, file_path: str = Query(default=None)):
+    """Accept a Supabase file path (via query param ?file_path=... or JSON body {"file_path": "..."}), remove its vectors and storage artifacts."""
+    try:
+        # Allow both query param and JSON body
+        if not file_path:
+            try:
+                body = await request.json()
+                if isinstance(body, dict):
+                    file_path = body.get("file_path")
+            except Exception:
+                # No/invalid JSON body; fall through to validation below
+                pass
+
+        if not file_path or not isinstance(file_path, str):
+            raise HTTPException(status_code=422, detail="file_path is required")
+        try:
+            file_path = document_path(file_path)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+
+        removed = await asyncio.to_thread(profiler.tracked(delete_document), file_path)
+        return JSONResponse({"deleted": removed})
+    except HTTPException:
+        # Re-raise HTTP exceptions untouched
+        raise
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:  # noqa: BLE001
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/debug/profiles", summary="List captured request profiles")
+async def list_profiles_endpoint(request: Request):
+    _require_admin(request)
+    return JSONResponse({"profiles": await asyncio.to_thread(profiler.list_profiles)})
+
+
+@app.get("/debug/profiles/{profile_id}", summary="Download a captured request profile")
+async def get_profile_endpoint(request: Request, profile_id: str, format: str = Query(default="json")):
+    """Return the profile as JSON, or with ?format=folded as folded stacks for flame graph tools."""
+    _require_admin(request)
+    profile = await asyncio.to_thread(profiler.load_profile, profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="profile not found")
+    if format == "folded":
+        return PlainTextResponse(folded(profile))
+    return JSONResponse(profile)
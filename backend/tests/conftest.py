@@ -0,0 +1,91 @@
+"""Test setup: make `lib` importable and stand in for cloud SDKs that are not installed.
+
+The lib modules create their Supabase/Vertex/Document AI clients at import
+time. Tests never reach those services, so when an SDK is missing it is
+replaced by a module whose attributes are MagicMocks; installed SDKs are used as they are.
+"""
+import importlib
+import os
+import sys
+import types
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_SDK_MODULES = [
+    "dotenv",
+    "vertexai",
+    "vertexai.language_models",
+    "google.generativeai",
+    "google.api_core.client_options",
+    "google.cloud.aiplatform",
+    "google.cloud.aiplatform.matching_engine",
+    "google.cloud.aiplatform.matching_engine.matching_engine_index_endpoint",
+    "google.cloud.aiplatform_v1beta1",
+    "google.cloud.aiplatform_v1beta1.types",
+    "google.cloud.documentai",
+    "google.cloud.documentai_v1",
+    "google.cloud.documentai_v1.types",
+]
+
+
+class _StubModule(types.ModuleType):
+    """Module whose every public attribute is a MagicMock."""
+
+    def __getattr__(self, name: str):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        value = mock.MagicMock(name=f"{self.__name__}.{name}")
+        setattr(self, name, value)
+        return value
+
+
+def _importable(name: str) -> bool:
+    try:
+        importlib.import_module(name)
+        return True
+    except ImportError:
+        return False
+
+
+def _package(name: str) -> types.ModuleType:
+    module = sys.modules.get(name)
+    if module is None:
+        module = types.ModuleType(name)
+        module.__path__ = []
+        sys.modules[name] = module
+    return module
+
+
+def _attach(name: str, module):
+    sys.modules[name] = module
+    parent, _, child = name.rpartition(".")
+    if parent:
+        setattr(sys.modules[parent], child, module)
+
+
+def _exceptions_module() -> types.ModuleType:
+    # deadline.py checks these with isinstance, so they must be real classes
+    module = types.ModuleType("google.api_core.exceptions")
+    module.GoogleAPICallError = type("GoogleAPICallError", (Exception,), {})
+    for name in ("TooManyRequests", "ServerError", "DeadlineExceeded", "Aborted", "NotFound"):
+        setattr(module, name, type(name, (module.GoogleAPICallError,), {}))
+    return module
+
+
+for _name in _SDK_MODULES:
+    if _name in sys.modules or _importable(_name):
+        continue
+    _parts = _name.split(".")
+    for _i in range(1, len(_parts)):
+        _prefix = ".".join(_parts[:_i])
+        if _prefix not in sys.modules and not _importable(_prefix):
+            _attach(_prefix, _package(_prefix))
+    _stub = _StubModule(_name)
+    _stub.__path__ = []
+    _attach(_name, _stub)
+
+if not _importable("google.api_core.exceptions"):
+    _package("google")
+    _attach("google.api_core", _package("google.api_core"))
+    _attach("google.api_core.exceptions", _exceptions_module())
@@ -0,0 +1,21 @@
+from lib import cache as cache_module
+from lib.cache import TieredCache
+
+
+def test_touch_times_are_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_module, "_TOUCHED_MAX_KEYS", 3)
+    cache = TieredCache(str(tmp_path / "cache" / "cache.sqlite3"), memory_max_bytes=0)
+    for n in range(10):
+        cache.set("ns", str(n), {"n": n})
+        assert cache.get("ns", str(n)) == {"n": n}
+    assert list(cache._touched) == [("ns", "7"), ("ns", "8"), ("ns", "9")]
+
+
+def test_evicted_entries_forget_their_touch_time(tmp_path):
+    cache = TieredCache(str(tmp_path / "cache" / "cache.sqlite3"), max_bytes=0, memory_max_bytes=0)
+    cache.set("ns", "a", "x" * 100)
+    cache.get("ns", "a")
+    assert ("ns", "a") in cache._touched
+    cache._evict_disk(cache._conn())
+    assert cache.get("ns", "a") is None
+    assert not cache._touched
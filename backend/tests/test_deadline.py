@@ -0,0 +1,149 @@
+import threading
+import time
+
+import httpx
+import pytest
+
+from lib import deadline
+from lib.deadline import DeadlineExceeded, RetryPolicy, StageTimeout, call, deadline_scope
+
+STAGE = "test_stage"
+
+
+@pytest.fixture
+def policy(monkeypatch):
+    """Install a policy for STAGE (no backoff, not scheduled); returns a setter."""
+
+    def use(**kwargs):
+        monkeypatch.setitem(deadline.POLICIES, STAGE, RetryPolicy(base_delay=0.0, **kwargs))
+
+    use()
+    return use
+
+
+@pytest.fixture
+def release():
+    """Event that stalled fakes wait on; set at teardown so no thread outlives the test."""
+    event = threading.Event()
+    yield event
+    event.set()
+    # Let abandoned attempts finish and drop out of the per-stage count
+    give_up = time.monotonic() + 5
+    while deadline.abandoned_attempts().get(STAGE) and time.monotonic() < give_up:
+        time.sleep(0.01)
+
+
+class _Upstream:
+    """Fails with `errors` in turn, then returns "ok"."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self, **kwargs):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+
+def _status_error(code):
+    request = httpx.Request("GET", "https://storage.test/object")
+    return httpx.HTTPStatusError("status", request=request, response=httpx.Response(code, request=request))
+
+
+def test_retryable_failures_are_retried(policy):
+    upstream = _Upstream(ConnectionError("reset"), _status_error(503))
+    assert call(STAGE, upstream) == "ok"
+    assert upstream.calls == 3
+
+
+def test_last_error_is_raised_once_attempts_run_out(policy):
+    policy(attempts=2)
+    upstream = _Upstream(ConnectionError("1"), ConnectionError("2"), ConnectionError("3"))
+    with pytest.raises(ConnectionError, match="2"):
+        call(STAGE, upstream)
+    assert upstream.calls == 2
+
+
+@pytest.mark.parametrize("error", [_status_error(404), _status_error(400), ValueError("bad input"), KeyError("text")])
+def test_client_errors_are_not_retried(policy, error):
+    upstream = _Upstream(error)
+    with pytest.raises(type(error)):
+        call(STAGE, upstream)
+    assert upstream.calls == 1
+
+
+@pytest.mark.parametrize("code", [408, 429])
+def test_throttling_and_request_timeouts_are_retried(policy, code):
+    upstream = _Upstream(_status_error(code))
+    assert call(STAGE, upstream) == "ok"
+    assert upstream.calls == 2
+
+
+def test_deadline_cuts_off_a_stalled_call(policy, release):
+    policy(attempts=3, timeout=10.0)
+    calls = []
+
+    def stalled():
+        calls.append(1)
+        release.wait(5)
+
+    started = time.monotonic()
+    with deadline_scope(0.2), pytest.raises(DeadlineExceeded):
+        call(STAGE, stalled)
+    assert time.monotonic() - started < 1.0
+    # The whole budget went to the first attempt; nothing was retried past it
+    assert len(calls) == 1
+
+
+def test_native_timeout_gets_the_attempt_budget(policy):
+    policy(timeout=5.0)
+    seen = {}
+
+    def upstream(timeout=None):
+        seen["timeout"] = timeout
+        return "ok"
+
+    with deadline_scope(1.0):
+        call(STAGE, upstream, native_timeout=deadline.timeout_kwarg)
+    assert 0 < seen["timeout"] <= 1.0
+
+
+def test_slow_read_is_hedged(policy, release):
+    policy(attempts=1, timeout=5.0, hedge_after=0.05)
+    calls = []
+
+    def slow_first():
+        calls.append(1)
+        if len(calls) == 1:
+            release.wait(5)
+            return "first"
+        return "hedge"
+
+    started = time.monotonic()
+    assert call(STAGE, slow_first) == "hedge"
+    assert time.monotonic() - started < 1.0
+    assert len(calls) == 2
+
+
+def test_abandoned_attempts_are_capped(policy, release, monkeypatch):
+    policy(attempts=1, timeout=0.05)
+    monkeypatch.setattr(deadline, "MAX_ABANDONED_ATTEMPTS", 2)
+    calls = []
+
+    def stalled():
+        calls.append(1)
+        release.wait(5)
+
+    for _ in range(2):
+        with pytest.raises(StageTimeout):
+            call(STAGE, stalled)
+    assert deadline.abandoned_attempts()[STAGE] == 2
+
+    # At the cap, further attempts fail fast without reaching the upstream
+    started = time.monotonic()
+    with pytest.raises(StageTimeout, match="still running"):
+        call(STAGE, stalled)
+    assert time.monotonic() - started < 0.05
+    assert len(calls) == 2
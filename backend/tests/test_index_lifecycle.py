@@ -0,0 +1,52 @@
+import uuid
+
+import pytest
+
+from lib import index_lifecycle
+
+
+class _Bucket:
+    """Records registry writes; fails them while `failing` is set."""
+
+    def __init__(self):
+        self.uploads = []
+        self.failing = False
+
+    def upload_sync(self, path, data, content_type="application/json", upsert=True, timeout=None):
+        self.uploads.append(path)
+        if self.failing:
+            raise ValueError("storage unavailable")
+
+
+@pytest.fixture
+def bucket(monkeypatch):
+    bucket = _Bucket()
+    monkeypatch.setattr(index_lifecycle.storage, "upload_sync", bucket.upload_sync)
+    monkeypatch.setattr(index_lifecycle, "_last_touch", {})
+    return bucket
+
+
+def test_document_path_accepts_only_uploaded_documents():
+    path = f"ocr/{uuid.uuid4()}.json"
+    assert index_lifecycle.document_path(index_lifecycle.PUBLIC_URL_PREFIX + path) == path
+    for bad in ("ocr/.json", "index/abc.json", f"ocr/../{uuid.uuid4()}.json", f"ocr/{uuid.uuid4()}.json.bak"):
+        with pytest.raises(ValueError):
+            index_lifecycle.document_path(bad)
+
+
+def test_touch_ignores_paths_that_are_not_documents(bucket):
+    index_lifecycle.touch_document("ocr/.json")
+    index_lifecycle.touch_document("anything")
+    assert bucket.uploads == []
+
+
+def test_failed_touch_is_logged_and_retried(bucket):
+    path = f"ocr/{uuid.uuid4()}.json"
+    bucket.failing = True
+    index_lifecycle.touch_document(path)  # does not raise
+    assert len(bucket.uploads) == 1
+
+    bucket.failing = False
+    index_lifecycle.touch_document(path)
+    index_lifecycle.touch_document(path)  # throttled after the first success
+    assert len(bucket.uploads) == 2
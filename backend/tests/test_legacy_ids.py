@@ -0,0 +1,30 @@
+import pytest
+
+from lib import rag_builder
+
+PATH = "ocr/794bd64f-22ce-4840-af5b-2d7fe3f039c0.json"
+
+
+@pytest.fixture
+def listing(monkeypatch):
+    calls = []
+
+    def list_sync(prefix, limit=100, offset=0, search=None, timeout=None):
+        calls.append((prefix, search))
+        return [{"name": PATH[4:], "created_at": "2026-10-01T12:00:00.000Z"}]
+
+    monkeypatch.setattr(rag_builder.storage, "list_sync", list_sync)
+    return calls
+
+
+def test_no_cutoff_means_no_legacy_ids(listing, monkeypatch):
+    monkeypatch.setattr(rag_builder, "LEGACY_CHUNK_IDS_BEFORE", "")
+    assert not rag_builder.may_have_legacy_ids(PATH)
+    assert listing == []
+
+
+@pytest.mark.parametrize("cutoff, expected", [("2026-10-02T00:00:00Z", True), ("2026-09-30T00:00:00Z", False)])
+def test_only_documents_uploaded_before_the_cutoff(listing, monkeypatch, cutoff, expected):
+    monkeypatch.setattr(rag_builder, "LEGACY_CHUNK_IDS_BEFORE", cutoff)
+    assert rag_builder.may_have_legacy_ids(PATH) is expected
+    assert listing == [("ocr", PATH[4:])]
@@ -0,0 +1,35 @@
+import pytest
+
+from lib import ocr
+
+
+@pytest.fixture
+def upload(monkeypatch, tmp_path):
+    calls = {"lookup": [], "record": [], "document_ai": 0}
+
+    def run_document_ai(content, pages=None, version=None):
+        calls["document_ai"] += 1
+        return {"text": "scanned", "pages": []}
+
+    monkeypatch.setattr(ocr, "resolve_processor_version", lambda: "v1")
+    monkeypatch.setattr(ocr, "lookup_ocr", lambda *args: calls["lookup"].append(args))
+    monkeypatch.setattr(ocr, "record_ocr", lambda *args: calls["record"].append(args))
+    monkeypatch.setattr(ocr, "_run_document_ai", run_document_ai)
+    monkeypatch.setattr(ocr, "touch_document", lambda path: None)
+    monkeypatch.setattr(ocr.storage, "upload_sync", lambda *args, **kwargs: {})
+    path = tmp_path / "scan.png"
+    path.write_bytes(b"not a pdf")
+    return str(path), calls
+
+
+def test_uploads_without_an_owner_are_not_deduplicated(upload):
+    path, calls = upload
+    ocr.process_document_sample(path)
+    assert calls == {"lookup": [], "record": [], "document_ai": 1}
+
+
+def test_authenticated_owner_is_the_dedup_key(upload):
+    path, calls = upload
+    ocr.process_document_sample(path, owner="user-1")
+    assert [args[2] for args in calls["lookup"]] == ["user-1"]
+    assert [args[2] for args in calls["record"]] == ["user-1"]
@@ -0,0 +1,19 @@
+import asyncio
+
+from lib import precompute, scheduler
+from lib.scheduler import ANALYSIS, INGESTION
+
+
+def test_user_facing_stages_run_at_analysis_priority(monkeypatch):
+    seen = {}
+
+    def stage(name):
+        def run(file_path):
+            seen[name] = scheduler._priority.get()
+        return run
+
+    monkeypatch.setattr(precompute, "index_document", stage("index"))
+    monkeypatch.setattr(precompute, "compute_summary", stage("summary"))
+    monkeypatch.setattr(precompute, "get_risk_statments", stage("risk"))
+    asyncio.run(precompute.precompute_analysis("ocr/doc.json"))
+    assert seen == {"index": INGESTION, "summary": ANALYSIS, "risk": ANALYSIS}
@@ -0,0 +1,77 @@
+import pytest
+
+from lib import rag_builder, risk_candidates
+
+CLAUSES = [
+    "This agreement is subject to a mandatory lock-in period of 12 months.",
+    "The Tenant must provide a written notice period of 90 days before vacating.",
+    "Subletting the property, in whole or in part, is strictly prohibited.",
+]
+
+
+def _doc_ai_json(paragraphs):
+    """Document-AI-shaped JSON with one page and one layout per paragraph."""
+    text, layouts = "", []
+    for paragraph in paragraphs:
+        start = len(text)
+        text += paragraph + "\n"
+        layouts.append({"layout": {"textAnchor": {"textSegments": [{"startIndex": str(start), "endIndex": str(len(text))}]}}})
+    return {"text": text, "pages": [{"paragraphs": layouts}]}
+
+
+def _neighbors(monkeypatch, result):
+    monkeypatch.setattr(risk_candidates, "_embedding_scores", result)
+
+
+def _select(paragraphs):
+    return risk_candidates.select_risk_candidates("ocr/doc.json", "doc", _doc_ai_json(paragraphs))
+
+
+def test_keyword_only_when_vector_search_fails(monkeypatch):
+    def unavailable(document_id):
+        raise RuntimeError("index unavailable")
+
+    _neighbors(monkeypatch, unavailable)
+    assert [c["text"] for c in _select(CLAUSES)] == CLAUSES
+
+
+def test_keyword_only_when_document_not_indexed_yet(monkeypatch):
+    # find_neighbors answers, but with no matches for any category
+    _neighbors(monkeypatch, lambda document_id: {name: {} for name in risk_candidates.RISK_CATEGORIES})
+    assert [c["text"] for c in _select(CLAUSES)] == CLAUSES
+
+
+def test_numbered_clauses_are_candidates(monkeypatch):
+    _neighbors(monkeypatch, lambda document_id: {})
+    paragraphs = [
+        "12. The Tenant agrees to indemnify and hold harmless the Landlord from all claims and damages.",
+        "7) This agreement is subject to a mandatory lock-in period of eleven months.",
+        "The Tenant shall bear all maintenance and repairs at the tenant's own expense.",
+    ]
+    # Indexing drops the numbered clauses as headings; candidate selection must not
+    assert rag_builder._is_low_value(paragraphs[0]) and rag_builder._is_low_value(paragraphs[1])
+    candidates = _select(paragraphs)
+    assert [c["text"] for c in candidates] == paragraphs
+    assert candidates[0]["categories"] == ["Indemnity Clause"]
+
+
+def test_window_scores_carry_over_to_their_paragraphs(monkeypatch):
+    paragraphs = [
+        "LEASE TERMS",
+        "The premises are let for residential use only by the family of the Tenant.",
+        "Rent is payable in advance on the first day of every month.",
+    ]
+    doc = _doc_ai_json(paragraphs)
+    windows = rag_builder.create_structural_chunks(doc, "doc", target_tokens=1000)
+    assert len(windows) == 1
+    monkeypatch.setattr(
+        risk_candidates, "load_chunk_set",
+        lambda *args, **kwargs: rag_builder.ChunkSet.from_chunks(windows, doc["text"], "doc"),
+    )
+    _neighbors(monkeypatch, lambda document_id: {"termination": {windows[0]["id"]: 1.0}})
+
+    # No keyword matches; the window's neighbor score reaches each of its paragraphs
+    candidates = _select(paragraphs)
+    assert [c["text"] for c in candidates] == paragraphs
+    assert all(c["categories"] == ["Termination Clause (By Landlord)"] for c in candidates)
+    assert all(c["score"] == pytest.approx(risk_candidates.EMBEDDING_WEIGHT) for c in candidates)
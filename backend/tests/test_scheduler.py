@@ -0,0 +1,23 @@
+import pytest
+
+from lib.scheduler import INGESTION, INTERACTIVE, Quota, _per_worker, _Upstream
+
+
+@pytest.mark.parametrize("slots, workers", [(4, 1), (4, 2), (8, 3), (16, 4), (2, 2)])
+def test_worker_shares_stay_within_the_node_quota(slots, workers):
+    share = _per_worker("test", Quota(max_concurrent=slots, reserved_interactive=2), workers)
+    assert share.max_concurrent * workers <= slots
+    if share.max_concurrent >= 2:
+        assert share.reserved_interactive >= 1
+
+
+def test_more_workers_than_slots_is_rejected():
+    with pytest.raises(ValueError):
+        _per_worker("test", Quota(max_concurrent=4), 5)
+
+
+def test_ingestion_leaves_an_interactive_slot_free():
+    upstream = _Upstream("test", _per_worker("test", Quota(max_concurrent=8, reserved_interactive=2), 4))
+    assert upstream.try_acquire(INGESTION)
+    assert not upstream.try_acquire(INGESTION)
+    assert upstream.try_acquire(INTERACTIVE)
@@ -0,0 +1,83 @@
+import asyncio
+import os
+
+import httpx
+import pytest
+
+from lib.storage import AsyncStorage, is_not_found
+
+BODY = b'{"text": "lease"}'
+
+
+class _Server:
+    """Storage API double: serves one object by ETag and honours Range."""
+
+    def __init__(self):
+        self.etag = '"v1"'
+        self.requests = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        if request.url.path != "/storage/v1/object/docs/ocr/a.json":
+            return httpx.Response(404, json={"error": "not_found"})
+        if request.headers.get("if-none-match") == self.etag:
+            return httpx.Response(304)
+        byte_range = request.headers.get("range")
+        if byte_range:
+            start, end = byte_range[len("bytes="):].split("-")
+            return httpx.Response(206, content=BODY[int(start):int(end) + 1])
+        return httpx.Response(200, content=BODY, headers={"etag": self.etag})
+
+
+@pytest.fixture
+def server():
+    return _Server()
+
+
+@pytest.fixture
+def storage(server, tmp_path):
+    client = AsyncStorage(
+        "https://storage.test", "key", "docs",
+        cache_dir=str(tmp_path / "blobs"), transport=httpx.MockTransport(server), http2=False,
+    )
+    yield client
+    client.close()
+
+
+def test_unchanged_object_is_revalidated_not_transferred(storage, server):
+    assert storage.download_sync("ocr/a.json") == BODY
+    assert storage.download_sync("ocr/a.json") == BODY
+    assert "if-none-match" not in server.requests[0].headers
+    assert server.requests[1].headers["if-none-match"] == '"v1"'
+
+    # A changed object is fetched again and replaces the cached copy
+    server.etag = '"v2"'
+    assert storage.download_sync("ocr/a.json") == BODY
+    assert storage._read_cache("ocr/a.json")[0] == '"v2"'
+
+
+def test_range_read(storage):
+    assert asyncio.run(storage.download_range("ocr/a.json", 2, 5)) == BODY[2:6]
+
+
+def test_missing_object_raises_not_found(storage):
+    with pytest.raises(httpx.HTTPStatusError) as excinfo:
+        storage.download_sync("ocr/missing.json")
+    assert is_not_found(excinfo.value)
+    assert not os.listdir(storage.cache_dir)
+
+
+def test_shared_cache_directory_is_not_used(server, tmp_path):
+    shared = tmp_path / "shared"
+    shared.mkdir(mode=0o777)
+    os.chmod(shared, 0o777)
+    client = AsyncStorage(
+        "https://storage.test", "key", "docs",
+        cache_dir=str(shared), transport=httpx.MockTransport(server), http2=False,
+    )
+    try:
+        assert client.download_sync("ocr/a.json") == BODY
+        assert client.cache_dir is None
+        assert not os.listdir(shared)
+    finally:
+        client.close()
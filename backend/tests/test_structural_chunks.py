@@ -0,0 +1,68 @@
+from lib import rag_builder
+from lib.chunk_store import ChunkSet
+
+RENT = "The Tenant shall pay a monthly rent of twenty thousand rupees on or before the fifth day of each month by bank transfer to the Landlord's account."
+DEPOSIT = "The Tenant has paid a refundable security deposit of one lakh rupees, returned within thirty days of vacating after deducting any unpaid dues."
+
+
+def _doc_ai_json(pages):
+    """Document-AI-shaped JSON; `pages` is a list of paragraph lists."""
+    text, out = "", []
+    for paragraphs in pages:
+        layouts = []
+        for paragraph in paragraphs:
+            start = len(text)
+            text += paragraph + "\n"
+            layouts.append({"layout": {"textAnchor": {"textSegments": [{"startIndex": str(start), "endIndex": str(len(text))}]}}})
+        out.append({"paragraphs": layouts})
+    return {"text": text, "pages": out}
+
+
+def _chunk(paragraphs, **kwargs):
+    return rag_builder.create_structural_chunks(_doc_ai_json([paragraphs]), "doc", **kwargs)
+
+
+def test_trailing_headings_are_kept():
+    paragraphs = ["AGREEMENT", RENT, DEPOSIT, "LANDLORD", "TENANT"]
+    chunks = _chunk(paragraphs)
+    assert len(chunks) == 1
+    assert chunks[0]["text"] == " ".join(paragraphs)
+
+
+def test_headings_stay_with_their_body():
+    # Each body alone is over the target
+    paragraphs = ["AGREEMENT", "1. Rent", RENT, "2. Deposit", DEPOSIT]
+    chunks = _chunk(paragraphs, target_tokens=30)
+    assert [c["text"] for c in chunks] == [
+        f"AGREEMENT 1. Rent {RENT}",
+        f"2. Deposit {DEPOSIT}",
+    ]
+
+
+def test_every_paragraph_is_in_a_chunk():
+    paragraphs = ["LEASE DEED", "1. Rent", RENT, "2. Deposit", DEPOSIT, "3. Term", RENT.replace("rent", "fee"), "Witnesses", "LANDLORD", "TENANT"]
+    for target in (20, 40, 60, 100, 300):
+        text = " ".join(c["text"] for c in _chunk(paragraphs, target_tokens=target))
+        assert all(p in text for p in paragraphs), target
+
+
+def test_tiny_trailing_window_merges_into_previous():
+    chunks = _chunk([RENT, DEPOSIT, "Signed:"], target_tokens=40)
+    assert [c["text"] for c in chunks] == [RENT, f"{DEPOSIT} Signed:"]
+
+
+def test_overlap_repeats_trailing_paragraphs():
+    short = "Rent is due on the fifth."
+    chunks = _chunk([RENT, short, DEPOSIT], target_tokens=45, overlap_tokens=10)
+    assert [c["text"] for c in chunks] == [f"{RENT} {short}", f"{short} {DEPOSIT}"]
+
+
+def test_page_span_and_text_slices():
+    doc = _doc_ai_json([[RENT], ["7"], [DEPOSIT]])
+    chunks = rag_builder.create_structural_chunks(doc, "doc", target_tokens=300)
+    assert len(chunks) == 1
+    assert (chunks[0]["page_start"], chunks[0]["page_end"]) == (1, 3)
+    # The page number between the paragraphs is not part of the window
+    assert chunks[0]["text"] == f"{RENT} {DEPOSIT}"
+    chunk_set = ChunkSet.from_chunks(chunks, doc["text"], "doc")
+    assert chunk_set.text_at(0) == chunks[0]["text"]